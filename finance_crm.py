@@ -183,11 +183,8 @@ class LoanCRM:
             dict: Un dizionario con i dati del cliente (vuoto se non trovato).
         """
         query = "SELECT * FROM clients WHERE client_id = %s"
-        cursor = self.db_manager.execute_db_query(query, (client_id,))
-        row = cursor.fetchone()
-        if row:
-            columns = [desc[0] for desc in cursor.description]
-            client = dict(zip(columns, row))
+        client = self.db_manager.execute_db_query(query, (client_id,)).first_dict()
+        if client:
             if client.get("documents"):
                 client["documents"] = json.loads(client["documents"])
             return client
@@ -201,17 +198,60 @@ class LoanCRM:
             list: Lista di dizionari contenenti i dati dei clienti.
         """
         query = "SELECT * FROM clients ORDER BY created_at DESC"
-        cursor = self.db_manager.execute_db_query(query)
-        rows = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
         clients = []
-        for row in rows:
-            client = dict(zip(columns, row))
+        for client in self.db_manager.execute_db_query(query).as_dicts():
             if client.get("documents"):
                 client["documents"] = json.loads(client["documents"])
             clients.append(client)
         return clients
 
+    def iter_clients(self, itersize: int = 2000):
+        """
+        Restituisce i clienti uno alla volta tramite un cursore lato server,
+        senza caricare l'intera tabella in memoria.
+        
+        Args:
+            itersize (int): Numero di righe scaricate dal server per ogni blocco.
+        
+        Yields:
+            dict: I dati di un cliente, nello stesso formato di list_clients.
+        """
+        query = "SELECT * FROM clients ORDER BY created_at DESC"
+        for client in self.db_manager.stream_query(query, itersize=itersize, as_dicts=True):
+            if client.get("documents"):
+                client["documents"] = json.loads(client["documents"])
+            yield client
+
+    def iter_client_features(self, itersize: int = 2000):
+        """
+        Restituisce, un cliente alla volta, le sole grandezze usate per la segmentazione
+        (reddito, età, credit score, regione, numero di prestiti e debito totale),
+        calcolate direttamente nel database.
+        
+        Args:
+            itersize (int): Numero di righe scaricate dal server per ogni blocco.
+        
+        Yields:
+            dict: Le feature di segmentazione di un cliente.
+        """
+        query = """
+        SELECT c.client_id,
+               c.income::float8 AS income,
+               c.credit_score::float8 AS credit_score,
+               DATE_PART('year', AGE(c.birth_date))::float8 AS age,
+               COALESCE(NULLIF(c.state, ''), NULLIF(c.city, ''), 'Unknown') AS region,
+               COALESCE(l.loan_count, 0)::float8 AS loan_count,
+               COALESCE(l.total_debt, 0)::float8 AS total_debt
+        FROM clients c
+        LEFT JOIN (
+            SELECT cl.client_id, COUNT(*) AS loan_count, SUM(lo.loan_amount) AS total_debt
+            FROM client_loans cl
+            JOIN loans lo ON cl.loan_id = lo.loan_id
+            GROUP BY cl.client_id
+        ) l ON l.client_id = c.client_id
+        """
+        return self.db_manager.stream_query(query, itersize=itersize, as_dicts=True)
+
     def assign_loan_to_client(self, client_id: str, loan_id: str) -> bool:
         """
         Associa un prestito a un cliente.
@@ -258,10 +298,7 @@ class LoanCRM:
             list: Lista di dizionari contenenti i dati delle interazioni.
         """
         query = "SELECT * FROM client_interactions WHERE client_id = %s ORDER BY interaction_date DESC"
-        cursor = self.db_manager.execute_db_query(query, (client_id,))
-        rows = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-        interactions = [dict(zip(columns, row)) for row in rows]
+        interactions = self.db_manager.execute_db_query(query, (client_id,)).as_dicts()
         return interactions
 
     def get_client_loans(self, client_id: str) -> list:
@@ -280,10 +317,7 @@ class LoanCRM:
         JOIN loans l ON cl.loan_id = l.loan_id
         WHERE cl.client_id = %s
         """
-        cursor = self.db_manager.execute_db_query(query, (client_id,))
-        rows = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-        loans = [dict(zip(columns, row)) for row in rows]
+        loans = self.db_manager.execute_db_query(query, (client_id,)).as_dicts()
         return loans
 
     def get_client_details(self, client_id: str) -> dict:
@@ -496,11 +530,8 @@ class LoanCRM:
             dict: Un dizionario con i dati dell'azienda (vuoto se non trovata).
         """
         query = "SELECT * FROM corporations WHERE corporation_id = %s"
-        cursor = self.db_manager.execute_db_query(query, (corporation_id,))
-        row = cursor.fetchone()
-        if row:
-            columns = [desc[0] for desc in cursor.description]
-            corporation = dict(zip(columns, row))
+        corporation = self.db_manager.execute_db_query(query, (corporation_id,)).first_dict()
+        if corporation:
             if corporation.get("documents"):
                 corporation["documents"] = json.loads(corporation["documents"])
             return corporation
@@ -514,17 +545,30 @@ class LoanCRM:
             list: Lista di dizionari contenenti i dati delle aziende.
         """
         query = "SELECT * FROM corporations ORDER BY created_at DESC"
-        cursor = self.db_manager.execute_db_query(query)
-        rows = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
         corporations = []
-        for row in rows:
-            corporation = dict(zip(columns, row))
+        for corporation in self.db_manager.execute_db_query(query).as_dicts():
             if corporation.get("documents"):
                 corporation["documents"] = json.loads(corporation["documents"])
             corporations.append(corporation)
         return corporations
 
+    def iter_corporations(self, itersize: int = 2000):
+        """
+        Restituisce le aziende una alla volta tramite un cursore lato server,
+        senza caricare l'intera tabella in memoria.
+        
+        Args:
+            itersize (int): Numero di righe scaricate dal server per ogni blocco.
+        
+        Yields:
+            dict: I dati di un'azienda, nello stesso formato di list_corporations.
+        """
+        query = "SELECT * FROM corporations ORDER BY created_at DESC"
+        for corporation in self.db_manager.stream_query(query, itersize=itersize, as_dicts=True):
+            if corporation.get("documents"):
+                corporation["documents"] = json.loads(corporation["documents"])
+            yield corporation
+
     def assign_loan_to_corporation(self, corporation_id: str, loan_id: str) -> bool:
         """
         Associa un prestito a un'azienda.
@@ -571,10 +615,7 @@ class LoanCRM:
             list: Lista di dizionari contenenti i dati delle interazioni.
         """
         query = "SELECT * FROM corporation_interactions WHERE corporation_id = %s ORDER BY interaction_date DESC"
-        cursor = self.db_manager.execute_db_query(query, (corporation_id,))
-        rows = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-        interactions = [dict(zip(columns, row)) for row in rows]
+        interactions = self.db_manager.execute_db_query(query, (corporation_id,)).as_dicts()
         return interactions
 
     def get_corporation_loans(self, corporation_id: str) -> list:
@@ -593,10 +634,7 @@ class LoanCRM:
         JOIN loans l ON cl.loan_id = l.loan_id
         WHERE cl.corporation_id = %s
         """
-        cursor = self.db_manager.execute_db_query(query, (corporation_id,))
-        rows = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-        loans = [dict(zip(columns, row)) for row in rows]
+        loans = self.db_manager.execute_db_query(query, (corporation_id,)).as_dicts()
         return loans
 
     def get_corporation_details(self, corporation_id: str) -> dict:
@@ -6,8 +6,12 @@ from dateutil.relativedelta import relativedelta
 import matplotlib.pyplot as plt
 import seaborn as sns
 import uuid
+import json
+import hashlib
 import psycopg2
+import psycopg2.extensions
 from psycopg2 import pool
+from psycopg2.extras import execute_values
 from scipy import stats
 from scipy.stats import norm
 from scipy.optimize import brentq
@@ -16,15 +20,280 @@ from ecbdata import ecbdata
 from datetime import datetime 
 import numba as nb
 import concurrent.futures
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
 import os
 from tqdm import tqdm
 import threading
+import time
+import asyncio
+from functools import lru_cache
+from contextlib import contextmanager
 
 #TODO: IMPELMENTARE SISTEMA CHECK DI PAGAMENTI
 
+def _schedule_rows(loan_id, table):
+    """
+    Converte il piano di ammortamento in tuple pronte per l'inserimento in blocco.
+    payment_id è derivato da (loan_id, data della rata): la stessa rata ha sempre lo stesso id.
+    """
+    loan_uuid = uuid.UUID(str(loan_id))
+    values = table[['Payment', 'Interest', 'Principal', 'Balance']].to_numpy(dtype=float).tolist()
+    return [
+        (str(uuid.uuid5(loan_uuid, payment_date.isoformat())), loan_id, payment_date, *row)
+        for payment_date, row in zip(table.index.date, values)
+    ]
+
+
+class ConnectionPoolManager:
+    """
+    Pool di connessioni limitato costruito su ThreadedConnectionPool.
+
+    - attesa con timeout quando tutte le connessioni sono in uso (invece di PoolError immediato);
+    - pre-ping delle connessioni rimaste inattive e sostituzione di quelle chiuse o troppo vecchie;
+    - rilevamento delle connessioni trattenute oltre leak_threshold secondi;
+    - statistiche di utilizzo (stats()) per il dimensionamento del pool.
+    """
+
+    def __init__(self, min_connections, max_connections, timeout=30.0, ping_after=60.0,
+                 max_lifetime=3600.0, leak_threshold=300.0, **connect_kwargs):
+        if max_connections < 1 or min_connections > max_connections:
+            raise ValueError("Invalid pool size")
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.max_lifetime = max_lifetime
+        self.leak_threshold = leak_threshold
+        self._pool = pool.ThreadedConnectionPool(min_connections, max_connections, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._created = {}      # id(conn) -> istante di apertura
+        self._last_used = {}    # id(conn) -> istante dell'ultima restituzione
+        self._checked_out = {}  # id(conn) -> (istante del prestito, nome del thread)
+        # Connessioni aperte e inattive nel pool: le min_connections aperte dal costruttore,
+        # più quelle restituite che il pool tiene aperte
+        self._idle = min_connections
+        self._closed = False
+        self._reported_leaks = set()
+        self._counters = {
+            'checkouts': 0, 'waits': 0, 'timeouts': 0, 'wait_time': 0.0,
+            'evicted': 0, 'peak_in_use': 0,
+        }
+
+    def _is_stale(self, conn, now):
+        key = id(conn)
+        if conn.closed:
+            return True
+        if now - self._created.setdefault(key, now) > self.max_lifetime:
+            return True
+        if now - self._last_used.get(key, now) > self.ping_after:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                conn.rollback()
+            except Exception:
+                return True
+        return False
+
+    def _evict(self, conn):
+        key = id(conn)
+        self._created.pop(key, None)
+        self._last_used.pop(key, None)
+        self._pool.putconn(conn, close=True)
+        with self._lock:
+            self._counters['evicted'] += 1
+
+    def getconn(self, timeout=None):
+        """Preleva una connessione sana dal pool, attendendo al massimo timeout secondi."""
+        if self._closed:
+            raise pool.PoolError("connection pool is closed")
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._counters['waits'] += 1
+            # Pool esaurito: spesso è sintomo di connessioni non restituite
+            self.check_leaks()
+            if not self._slots.acquire(timeout=timeout):
+                with self._lock:
+                    self._counters['timeouts'] += 1
+                raise pool.PoolError(
+                    f"No connection available within {timeout:.1f}s "
+                    f"({self.max_connections} in use)"
+                )
+        try:
+            while True:
+                conn = self._pool.getconn()
+                with self._lock:
+                    # Il pool consegna prima le connessioni inattive, poi ne apre di nuove
+                    self._idle = max(0, self._idle - 1)
+                if not self._is_stale(conn, time.time()):
+                    break
+                print("WARN: Connessione al database non valida, la sostituisco")
+                self._evict(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._checked_out[id(conn)] = (time.time(), threading.current_thread().name)
+            self._counters['checkouts'] += 1
+            self._counters['wait_time'] += time.monotonic() - started
+            self._counters['peak_in_use'] = max(self._counters['peak_in_use'], len(self._checked_out))
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Restituisce una connessione al pool annullando eventuali transazioni lasciate aperte."""
+        key = id(conn)
+        with self._lock:
+            if self._checked_out.pop(key, None) is None:
+                return
+            self._reported_leaks.discard(key)
+        try:
+            if not close and not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except Exception:
+            close = True
+        try:
+            if close or conn.closed:
+                self._evict(conn)
+            else:
+                self._last_used[key] = time.time()
+                self._pool.putconn(conn)
+                # Oltre min_connections il pool chiude la connessione invece di tenerla inattiva
+                if not conn.closed:
+                    with self._lock:
+                        self._idle += 1
+        finally:
+            self._slots.release()
+
+    def check_leaks(self):
+        """Segnala le connessioni trattenute oltre leak_threshold secondi e le restituisce come lista."""
+        now = time.time()
+        with self._lock:
+            leaks = [
+                (key, now - since, thread_name)
+                for key, (since, thread_name) in self._checked_out.items()
+                if now - since > self.leak_threshold
+            ]
+            new_leaks = [leak for leak in leaks if leak[0] not in self._reported_leaks]
+            self._reported_leaks.update(leak[0] for leak in new_leaks)
+        for _, held_for, thread_name in new_leaks:
+            print(f"WARN: Connessione trattenuta da {held_for:.0f}s dal thread '{thread_name}' (possibile leak)")
+        return [(held_for, thread_name) for _, held_for, thread_name in leaks]
+
+    def stats(self):
+        """Statistiche di utilizzo del pool per il capacity planning."""
+        leaks = self.check_leaks()
+        with self._lock:
+            in_use = len(self._checked_out)
+            idle = self._idle
+            counters = dict(self._counters)
+        checkouts = counters.pop('checkouts')
+        wait_time = counters.pop('wait_time')
+        return {
+            'min_connections': self.min_connections,
+            'max_connections': self.max_connections,
+            'in_use': in_use,
+            'idle': idle,
+            'utilization': in_use / self.max_connections,
+            'checkouts': checkouts,
+            'avg_wait_ms': 1000 * wait_time / checkouts if checkouts else 0.0,
+            'leaked': len(leaks),
+            **counters,
+        }
+
+    def closeall(self):
+        """
+        Chiude tutte le connessioni, anche quelle ancora in prestito, e rifiuta nuovi prelievi.
+        Gli slot delle connessioni in prestito vengono liberati qui: un putconn successivo
+        di quelle connessioni non ha più effetto.
+        """
+        with self._lock:
+            outstanding = len(self._checked_out)
+            self._checked_out.clear()
+            self._reported_leaks.clear()
+            self._idle = 0
+            self._closed = True
+        for _ in range(outstanding):
+            self._slots.release()
+        self._created.clear()
+        self._last_used.clear()
+        self._pool.closeall()
+
+
+class QueryResult:
+    """
+    Risultato di una query già completamente letto dal cursore.
+    Espone la stessa interfaccia di lettura di un cursore DB-API (fetchone, fetchall,
+    description, rowcount) ma non dipende più dalla connessione, che è già tornata nel pool:
+    può quindi essere consumato da qualunque thread.
+    """
+
+    __slots__ = ('rows', 'description', 'rowcount', '_position')
+
+    def __init__(self, rows, description, rowcount):
+        self.rows = rows
+        self.description = description
+        self.rowcount = rowcount
+        self._position = 0
+
+    @classmethod
+    def from_cursor(cls, cursor):
+        rows = cursor.fetchall() if cursor.description is not None else []
+        return cls(rows, cursor.description, cursor.rowcount)
+
+    @property
+    def columns(self):
+        return [desc[0] for desc in self.description] if self.description else []
+
+    def fetchone(self):
+        if self._position >= len(self.rows):
+            return None
+        row = self.rows[self._position]
+        self._position += 1
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self.rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self.rows[self._position:]
+        self._position = len(self.rows)
+        return rows
+
+    def close(self):
+        """Compatibilità con il vecchio codice che chiudeva il cursore restituito."""
+        pass
+
+    def as_dicts(self):
+        """Tutte le righe come dizionari {colonna: valore}."""
+        columns = self.columns
+        return [dict(zip(columns, row)) for row in self.rows]
+
+    def first_dict(self):
+        """La prima riga come dizionario, oppure {} se la query non ha restituito righe."""
+        return dict(zip(self.columns, self.rows[0])) if self.rows else {}
+
+    def column(self, name, dtype=None):
+        """I valori di una colonna come array numpy."""
+        index = self.columns.index(name)
+        return np.array([row[index] for row in self.rows], dtype=dtype)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
 class DbManager:
-    def __init__(self, dbname, user, password, host='localhost', port='5432', min_connections=1, max_connections=1000000000000000000000000000000000000000000000000000000000000000000000000000000000):
+    def __init__(self, dbname, user, password, host='localhost', port='5432', min_connections=1, max_connections=50,
+                 pool_timeout=30.0, leak_threshold=300.0):
         self.dbname = dbname
         self.user = user
         self.password = password
@@ -32,15 +301,19 @@ class DbManager:
         self.port = port
         self.min_connections = min_connections
         self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self.leak_threshold = leak_threshold
         self._pool = None
         self._init_pool()
  
     def _init_pool(self):
         """Initialize the connection pool"""
         try:
-            self._pool = psycopg2.pool.ThreadedConnectionPool(
+            self._pool = ConnectionPoolManager(
                 self.min_connections,
                 self.max_connections,
+                timeout=self.pool_timeout,
+                leak_threshold=self.leak_threshold,
                 dbname=self.dbname,
                 user=self.user,
                 password=self.password,
@@ -52,38 +325,55 @@ class DbManager:
             print(f"ERROR: Could not initialize connection pool: {str(e)}")
             raise
 
-    def get_connection(self):
-        """Get a connection from the pool"""
+    def get_connection(self, timeout=None):
+        """Get a connection from the pool, waiting up to timeout seconds if it is exhausted"""
         if self._pool is None:
             self._init_pool()
         try:
-            return self._pool.getconn()
+            return self._pool.getconn(timeout)
         except Exception as e:
             print(f"ERROR: Failed to get connection from pool: {str(e)}")
-            # Try to re-initialize the pool and get connection again
-            self._init_pool()
-            return self._pool.getconn()
+            raise
 
     def release_connection(self, conn):
         """Return a connection to the pool"""
         if self._pool is not None and conn is not None:
             self._pool.putconn(conn)
 
+    @contextmanager
+    def connection(self, timeout=None):
+        """Presta una connessione del pool per la durata del blocco with"""
+        conn = self.get_connection(timeout)
+        try:
+            yield conn
+        finally:
+            self.release_connection(conn)
+
+    def pool_stats(self):
+        """Statistiche di utilizzo del pool di connessioni"""
+        if self._pool is None:
+            return {}
+        return self._pool.stats()
+
     def connect(self):
         """Legacy method for backward compatibility"""
         print(f"DEBUG: Getting connection from pool for DB {self.dbname} via connect() method")
         return self.get_connection()
 
     def execute_db_query(self, query, parameters=()):
+        """
+        Esegue una query e ne restituisce il risultato completamente materializzato
+        (QueryResult) dopo aver restituito la connessione al pool.
+        """
         conn = None
         cursor = None
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             cursor.execute(query, parameters)
+            result = QueryResult.from_cursor(cursor)
             conn.commit()
-            result = cursor  # Save the cursor for result access
-            return cursor
+            return result
         except Exception as e:
             if conn:
                 conn.rollback()
@@ -91,12 +381,45 @@ class DbManager:
             raise
         finally:
             if cursor:
-                # Don't close the cursor here as it's being returned
-                # The caller is responsible for processing the cursor results
-                pass
+                cursor.close()
             if conn:
                 self.release_connection(conn)
 
+    def stream_query(self, query, parameters=(), itersize=2000, as_dicts=False):
+        """
+        Esegue una SELECT su un cursore lato server (named cursor) e ne restituisce le righe
+        una alla volta, scaricandole dal server a blocchi di itersize righe.
+        La connessione resta in prestito finché il generatore non è esaurito o chiuso:
+        va quindi consumato per intero oppure chiuso esplicitamente (es. contextlib.closing).
+        """
+        conn = None
+        cursor = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+            cursor.itersize = itersize
+            cursor.execute(query, parameters)
+            columns = None
+            for row in cursor:
+                if as_dicts:
+                    if columns is None:
+                        columns = [desc[0] for desc in cursor.description]
+                    yield dict(zip(columns, row))
+                else:
+                    yield row
+        except Exception as e:
+            print(f"Streaming query error: {str(e)}")
+            raise
+        finally:
+            if cursor:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+            if conn:
+                # Transazione di sola lettura: la chiusura via putconn la annulla
+                self.release_connection(conn)
+
     def create_db(self):
         conn = None
         cursor = None
@@ -148,9 +471,53 @@ class DbManager:
             )
             ''')
 
+            # Marcature temporali per capire se il piano salvato riflette i dati correnti del prestito
+            cursor.execute('''
+            ALTER TABLE loans ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
+            ALTER TABLE amortization_schedule ADD COLUMN IF NOT EXISTS computed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
+            ALTER TABLE loans ADD COLUMN IF NOT EXISTS schedule_updated_at TIMESTAMP WITH TIME ZONE;
+            ''')
+            # Database esistenti: il piano è aggiornato alla data della sua riga più vecchia
+            cursor.execute('''
+            UPDATE loans l SET schedule_updated_at = s.computed_at
+            FROM (SELECT loan_id, MIN(computed_at) AS computed_at FROM amortization_schedule GROUP BY loan_id) s
+            WHERE s.loan_id = l.loan_id AND l.schedule_updated_at IS NULL
+            ''')
+
+            # Il piano è identificato da (loan_id, payment_date): il salvataggio aggiorna solo le rate cambiate.
+            # Prima di creare l'indice univoco si eliminano eventuali rate duplicate.
+            cursor.execute("SELECT to_regclass('idx_amortization_loan_date') IS NULL")
+            if cursor.fetchone()[0]:
+                cursor.execute('''
+                DELETE FROM amortization_schedule a
+                USING amortization_schedule b
+                WHERE a.loan_id = b.loan_id AND a.payment_date = b.payment_date
+                  AND a.payment_id < b.payment_id
+                ''')
+                cursor.execute('''
+                CREATE UNIQUE INDEX idx_amortization_loan_date ON amortization_schedule(loan_id, payment_date);
+                DROP INDEX IF EXISTS idx_amortization_loan_id;
+                ''')
+
+            # Metriche di portafoglio mantenute in modo incrementale da save/update/delete_loan
+            cursor.execute('''CREATE TABLE IF NOT EXISTS portfolio_metrics(
+                amortization_type VARCHAR(20) NOT NULL,
+                frequency VARCHAR(20) NOT NULL,
+                loan_count INTEGER NOT NULL DEFAULT 0,
+                total_amount DECIMAL(18,2) NOT NULL DEFAULT 0,
+                sum_rate DECIMAL(18,6) NOT NULL DEFAULT 0,
+                sum_term BIGINT NOT NULL DEFAULT 0,
+                total_interest DECIMAL(18,2) NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (amortization_type, frequency)
+            )
+            ''')
+            cursor.execute("SELECT NOT EXISTS (SELECT 1 FROM portfolio_metrics)")
+            if cursor.fetchone()[0]:
+                self._rebuild_portfolio_metrics(cursor)
+
             # Creazione degli indici
             cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_amortization_loan_id ON amortization_schedule(loan_id);
             CREATE INDEX IF NOT EXISTS idx_additional_costs_loan_id ON additional_costs(loan_id);
             CREATE INDEX IF NOT EXISTS idx_periodic_expenses_loan_id ON periodic_expenses(loan_id);
             ''')
@@ -167,83 +534,263 @@ class DbManager:
             if conn:
                 self.release_connection(conn)
 
+    @staticmethod
+    def _bulk_insert(cursor, query, rows):
+        """
+        Inserisce tutte le righe con un unico INSERT multi-riga.
+        page_size pari al numero di righe evita che execute_values spezzi il batch.
+        """
+        if rows:
+            execute_values(cursor, query, rows, page_size=len(rows))
+
+    @staticmethod
+    def _apply_metrics_delta(cursor, loan_ids, sign):
+        """
+        Aggiunge (sign=1) o sottrae (sign=-1) il contributo di uno o più prestiti, così come
+        sono salvati in quel momento, alle metriche del loro gruppo (tipo di ammortamento, frequenza).
+        Va eseguito nella stessa transazione che modifica i prestiti: con sign=-1 prima
+        della modifica, con sign=1 dopo. I prestiti inesistenti vengono ignorati.
+        """
+        if isinstance(loan_ids, str):
+            loan_ids = [loan_ids]
+        cursor.execute("""
+            WITH changed AS (
+                SELECT loan_id, amortization_type, frequency, loan_amount, initial_rate, initial_term
+                FROM loans
+                WHERE loan_id = ANY(%(loan_ids)s::uuid[])
+                FOR UPDATE
+            ), interest AS (
+                SELECT loan_id, SUM(interest) AS total
+                FROM amortization_schedule
+                WHERE loan_id = ANY(%(loan_ids)s::uuid[])
+                GROUP BY loan_id
+            )
+            INSERT INTO portfolio_metrics AS pm (
+                amortization_type, frequency, loan_count, total_amount,
+                sum_rate, sum_term, total_interest
+            )
+            SELECT c.amortization_type, c.frequency, %(sign)s * COUNT(*), %(sign)s * SUM(c.loan_amount),
+                   %(sign)s * SUM(c.initial_rate), %(sign)s * SUM(c.initial_term),
+                   %(sign)s * COALESCE(SUM(i.total), 0)
+            FROM changed c
+            LEFT JOIN interest i ON i.loan_id = c.loan_id
+            GROUP BY c.amortization_type, c.frequency
+            ON CONFLICT (amortization_type, frequency) DO UPDATE SET
+                loan_count = pm.loan_count + EXCLUDED.loan_count,
+                total_amount = pm.total_amount + EXCLUDED.total_amount,
+                sum_rate = pm.sum_rate + EXCLUDED.sum_rate,
+                sum_term = pm.sum_term + EXCLUDED.sum_term,
+                total_interest = pm.total_interest + EXCLUDED.total_interest,
+                updated_at = CURRENT_TIMESTAMP
+        """, {'loan_ids': list(loan_ids), 'sign': sign})
+
+    @staticmethod
+    def _rebuild_portfolio_metrics(cursor):
+        """Ricalcola da zero la tabella portfolio_metrics a partire da loans e amortization_schedule."""
+        cursor.execute("""
+            DELETE FROM portfolio_metrics;
+            INSERT INTO portfolio_metrics (
+                amortization_type, frequency, loan_count, total_amount,
+                sum_rate, sum_term, total_interest
+            )
+            SELECT l.amortization_type, l.frequency, COUNT(*), SUM(l.loan_amount),
+                   SUM(l.initial_rate), SUM(l.initial_term), COALESCE(SUM(s.interest), 0)
+            FROM loans l
+            LEFT JOIN (
+                SELECT loan_id, SUM(interest) AS interest FROM amortization_schedule GROUP BY loan_id
+            ) s ON s.loan_id = l.loan_id
+            GROUP BY l.amortization_type, l.frequency;
+        """)
+
+    def rebuild_portfolio_metrics(self):
+        """Ricostruisce le metriche di portafoglio (es. dopo modifiche fatte fuori da DbManager)."""
+        conn = None
+        cursor = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            self._rebuild_portfolio_metrics(cursor)
+            conn.commit()
+            return True
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            print(f"Error rebuilding portfolio metrics: {str(e)}")
+            return False
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self.release_connection(conn)
+
+    @staticmethod
+    def _write_schedules(cursor, loans):
+        """
+        Allinea i piani salvati a quelli correnti dei prestiti con un'unica istruzione:
+        le rate sono confrontate per (loan_id, payment_date), vengono riscritte solo
+        quelle con importi diversi, inserite quelle nuove ed eliminate quelle non più previste.
+        """
+        rows = [row for loan in loans for row in _schedule_rows(loan.loan_id, loan.table)]
+        if not rows:
+            return
+        execute_values(cursor, """
+            WITH incoming (payment_id, loan_id, payment_date, amount, interest, principal, balance) AS (
+                VALUES %s
+            ), removed AS (
+                DELETE FROM amortization_schedule s
+                WHERE s.loan_id IN (SELECT DISTINCT loan_id FROM incoming)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM incoming i
+                      WHERE i.loan_id = s.loan_id AND i.payment_date = s.payment_date
+                  )
+            ), synced AS (
+                UPDATE loans SET schedule_updated_at = CURRENT_TIMESTAMP
+                WHERE loan_id IN (SELECT DISTINCT loan_id FROM incoming)
+            )
+            INSERT INTO amortization_schedule AS s (
+                payment_id, loan_id, payment_date, amount, interest, principal, balance
+            )
+            SELECT payment_id, loan_id, payment_date, amount, interest, principal, balance FROM incoming
+            ON CONFLICT (loan_id, payment_date) DO UPDATE SET
+                amount = EXCLUDED.amount, interest = EXCLUDED.interest,
+                principal = EXCLUDED.principal, balance = EXCLUDED.balance,
+                computed_at = CURRENT_TIMESTAMP
+            WHERE (s.amount, s.interest, s.principal, s.balance)
+                  IS DISTINCT FROM (EXCLUDED.amount, EXCLUDED.interest, EXCLUDED.principal, EXCLUDED.balance)
+            """,
+            rows,
+            template="(%s::uuid, %s::uuid, %s::date, %s::DECIMAL(15,2), %s::DECIMAL(15,2), "
+                     "%s::DECIMAL(15,2), %s::DECIMAL(15,2))",
+            page_size=len(rows)
+        )
+
+    def _write_full_loan(self, cursor, loan):
+        """Scrive anagrafica, costi e spese di un prestito per intero e ne allinea il piano."""
+        # Convert numpy values to Python native types
+        initial_rate = float(loan.initial_rate)
+        initial_term = int(loan.initial_term)
+        loan_amount = float(loan.loan_amount)
+        downpayment_percent = float(loan.downpayment_percent)
+        
+        # Toglie dalle metriche di portafoglio il contributo della versione già salvata
+        self._apply_metrics_delta(cursor, loan.loan_id, -1)
+
+        # Upsert dei dati anagrafici del prestito in un'unica istruzione
+        cursor.execute('''
+            INSERT INTO loans (
+                loan_id, initial_rate, initial_term, loan_amount, 
+                amortization_type, frequency, rate_type, use_euribor,
+                update_frequency, downpayment_percent, start_date, active
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (loan_id) DO UPDATE SET
+                initial_rate = EXCLUDED.initial_rate, initial_term = EXCLUDED.initial_term,
+                loan_amount = EXCLUDED.loan_amount, amortization_type = EXCLUDED.amortization_type,
+                frequency = EXCLUDED.frequency, rate_type = EXCLUDED.rate_type,
+                use_euribor = EXCLUDED.use_euribor, update_frequency = EXCLUDED.update_frequency,
+                downpayment_percent = EXCLUDED.downpayment_percent,
+                start_date = EXCLUDED.start_date, active = EXCLUDED.active,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (
+            loan.loan_id, initial_rate, initial_term, loan_amount,
+            loan.amortization_type, loan.frequency, loan.rate_type,
+            loan.use_euribor, loan.update_frequency, downpayment_percent,
+            loan.start.date(), loan.active
+        ))
+
+        # Rimuove costi e spese precedenti con un solo round-trip
+        cursor.execute("""
+            WITH deleted_costs AS (
+                DELETE FROM additional_costs WHERE loan_id = %(loan_id)s
+            )
+            DELETE FROM periodic_expenses WHERE loan_id = %(loan_id)s
+        """, {'loan_id': loan.loan_id})
+
+        # Save additional costs (one-time costs)
+        self._bulk_insert(
+            cursor,
+            "INSERT INTO additional_costs (loan_id, description, amount) VALUES %s",
+            [(loan.loan_id, desc, float(amount)) for desc, amount in loan.additional_costs.items()]
+        )
+
+        # Save periodic expenses (recurring costs)
+        self._bulk_insert(
+            cursor,
+            "INSERT INTO periodic_expenses (loan_id, description, amount) VALUES %s",
+            [(loan.loan_id, desc, float(amount)) for desc, amount in loan.periodic_expenses.items()]
+        )
+
+        # Save amortization table (solo le rate cambiate se il prestito era già salvato)
+        self._write_schedules(cursor, [loan])
+
+        self._apply_metrics_delta(cursor, loan.loan_id, 1)
+
+    def _write_amount_changes(self, cursor, changes_list):
+        """Applica a additional_costs e periodic_expenses le voci modificate o rimosse di più prestiti."""
+        for table, changed, removed in (
+            ('additional_costs', [(c.loan_id, c.costs) for c in changes_list],
+             [(c.loan_id, desc) for c in changes_list for desc in c.removed_costs]),
+            ('periodic_expenses', [(c.loan_id, c.expenses) for c in changes_list],
+             [(c.loan_id, desc) for c in changes_list for desc in c.removed_expenses]),
+        ):
+            if removed:
+                execute_values(cursor, f"""
+                    DELETE FROM {table} AS t
+                    USING (VALUES %s) AS r(loan_id, description)
+                    WHERE t.loan_id = r.loan_id::uuid AND t.description = r.description
+                """, removed, page_size=len(removed))
+            self._bulk_insert(
+                cursor,
+                f"""
+                INSERT INTO {table} (loan_id, description, amount) VALUES %s
+                ON CONFLICT (loan_id, description) DO UPDATE SET amount = EXCLUDED.amount
+                """,
+                [(loan_id, desc, amount) for loan_id, amounts in changed for desc, amount in amounts.items()]
+            )
+
+    def _write_loan_changes(self, cursor, loan, changes):
+        """Scrive solo le colonne, le voci di costo e il piano toccati dalle modifiche."""
+        metrics_affected = bool(changes.fields or changes.schedule)
+        if metrics_affected:
+            self._apply_metrics_delta(cursor, loan.loan_id, -1)
+
+        if changes.fields:
+            # I nomi di colonna provengono da Loan._PERSISTED_COLUMNS, mai dall'input dell'utente
+            assignments = [f"{column} = %({column})s" for column in changes.fields]
+            if changes.schedule:
+                assignments.append("updated_at = CURRENT_TIMESTAMP")
+            cursor.execute(
+                f"UPDATE loans SET {', '.join(assignments)} WHERE loan_id = %(loan_id)s",
+                {**changes.fields, 'loan_id': loan.loan_id}
+            )
+
+        self._write_amount_changes(cursor, [changes])
+
+        if changes.schedule:
+            self._write_schedules(cursor, [loan])
+
+        if metrics_affected:
+            self._apply_metrics_delta(cursor, loan.loan_id, 1)
+
     def save_loan(self, loan):
+        """
+        Salva il prestito consumando il registro delle modifiche (Loan.pending_changes):
+        un prestito nuovo viene scritto per intero, uno già salvato solo nelle colonne,
+        nelle voci di costo e nel piano effettivamente cambiati.
+        """
+        changes = loan.pending_changes()
+        if not changes:
+            return True
+
         conn = None
         cursor = None
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
-            
-            # Convert numpy values to Python native types
-            initial_rate = float(loan.initial_rate)
-            initial_term = int(loan.initial_term)
-            loan_amount = float(loan.loan_amount)
-            downpayment_percent = float(loan.downpayment_percent)
-            
-            # Check if loan exists
-            check_query = "SELECT COUNT(*) FROM loans WHERE loan_id = %s"
-            cursor.execute(check_query, (loan.loan_id,))
-            exists = cursor.fetchone()[0] > 0
-            
-            if exists:
-                update_query = '''
-                UPDATE loans SET 
-                    initial_rate = %s, initial_term = %s, loan_amount = %s, 
-                    amortization_type = %s, frequency = %s, rate_type = %s,
-                    use_euribor = %s, update_frequency = %s, downpayment_percent = %s,
-                    start_date = %s, active = %s
-                WHERE loan_id = %s
-                '''
-                cursor.execute(update_query, (
-                    initial_rate, initial_term, loan_amount,
-                    loan.amortization_type, loan.frequency, loan.rate_type,
-                    loan.use_euribor, loan.update_frequency, downpayment_percent,
-                    loan.start.date(), loan.active, loan.loan_id
-                ))
-            else:
-                insert_query = '''
-                INSERT INTO loans (
-                    loan_id, initial_rate, initial_term, loan_amount, 
-                    amortization_type, frequency, rate_type, use_euribor,
-                    update_frequency, downpayment_percent, start_date, active
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                '''
-                cursor.execute(insert_query, (
-                    loan.loan_id, initial_rate, initial_term, loan_amount,
-                    loan.amortization_type, loan.frequency, loan.rate_type,
-                    loan.use_euribor, loan.update_frequency, downpayment_percent,
-                    loan.start.date(), loan.active
-                ))
 
-            # Save additional costs (one-time costs)
-            cursor.execute("DELETE FROM additional_costs WHERE loan_id = %s", (loan.loan_id,))
-            for desc, amount in loan.additional_costs.items():
-                cursor.execute("""
-                    INSERT INTO additional_costs (loan_id, description, amount)
-                    VALUES (%s, %s, %s)
-                """, (loan.loan_id, desc, float(amount)))
-
-            # Save periodic expenses (recurring costs)
-            cursor.execute("DELETE FROM periodic_expenses WHERE loan_id = %s", (loan.loan_id,))
-            for desc, amount in loan.periodic_expenses.items():
-                cursor.execute("""
-                    INSERT INTO periodic_expenses (loan_id, description, amount)
-                    VALUES (%s, %s, %s)
-                """, (loan.loan_id, desc, float(amount)))
-                
-            # Save amortization table
-            cursor.execute("DELETE FROM amortization_schedule WHERE loan_id = %s", (loan.loan_id,))
-            for index, row in loan.table.iterrows():
-                cursor.execute("""
-                    INSERT INTO amortization_schedule (
-                        payment_id, loan_id, payment_date, 
-                        amount, interest, principal, balance
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    str(uuid.uuid4()), loan.loan_id, index.date(),
-                    float(row['Payment']), float(row['Interest']), 
-                    float(row['Principal']), float(row['Balance'])
-                ))
+            if changes.is_new:
+                self._write_full_loan(cursor, loan)
+            else:
+                self._write_loan_changes(cursor, loan, changes)
 
             conn.commit()
             return True
@@ -266,6 +813,9 @@ class DbManager:
             conn = self.get_connection()
             cursor = conn.cursor()
             
+            # Toglie il prestito dalle metriche di portafoglio prima di cancellarne il piano
+            self._apply_metrics_delta(cursor, loan_id, -1)
+            
             # Delete related records first
             tables = [
                 "amortization_schedule",
@@ -308,19 +858,37 @@ class DbManager:
             conn = self.get_connection()
             cursor = conn.cursor()
             
+            # updated_at avanza solo se cambia un campo che incide sul piano di ammortamento;
+            # il piano viene riallineato nella stessa transazione, così le metriche di portafoglio
+            # reinseriscono gli interessi del piano aggiornato
             query = '''
             UPDATE loans SET
-                initial_rate = %s, initial_term = %s, loan_amount = %s, amortization_type = %s, 
-                frequency = %s, rate_type = %s, use_euribor = %s, update_frequency = %s, 
-                downpayment_percent = %s, start_date = %s, active = %s
-            WHERE loan_id = %s
+                initial_rate = %(initial_rate)s, initial_term = %(initial_term)s, loan_amount = %(loan_amount)s,
+                amortization_type = %(amortization_type)s, frequency = %(frequency)s, rate_type = %(rate_type)s,
+                use_euribor = %(use_euribor)s, update_frequency = %(update_frequency)s, 
+                downpayment_percent = %(downpayment_percent)s, start_date = %(start_date)s, active = %(active)s,
+                updated_at = CASE
+                    WHEN (initial_rate, initial_term, loan_amount, amortization_type, frequency,
+                          rate_type, use_euribor, update_frequency, downpayment_percent, start_date)
+                         IS DISTINCT FROM
+                         (%(initial_rate)s::DECIMAL(8,6), %(initial_term)s, %(loan_amount)s::DECIMAL(15,2),
+                          %(amortization_type)s, %(frequency)s, %(rate_type)s, %(use_euribor)s,
+                          %(update_frequency)s, %(downpayment_percent)s::DECIMAL(5,2), %(start_date)s::DATE)
+                    THEN CURRENT_TIMESTAMP ELSE updated_at
+                END
+            WHERE loan_id = %(loan_id)s
             '''
-            parameters = (
-                float(loan.initial_rate), int(loan.initial_term), float(loan.loan_amount), loan.amortization_type, 
-                loan.frequency, loan.rate_type, loan.use_euribor, loan.update_frequency, 
-                float(loan.downpayment_percent), loan.start.date(), loan.active, loan.loan_id
-            )
+            parameters = {
+                'initial_rate': float(loan.initial_rate), 'initial_term': int(loan.initial_term),
+                'loan_amount': float(loan.loan_amount), 'amortization_type': loan.amortization_type, 
+                'frequency': loan.frequency, 'rate_type': loan.rate_type, 'use_euribor': loan.use_euribor,
+                'update_frequency': loan.update_frequency, 'downpayment_percent': float(loan.downpayment_percent),
+                'start_date': loan.start.date(), 'active': loan.active, 'loan_id': loan.loan_id
+            }
+            self._apply_metrics_delta(cursor, loan.loan_id, -1)
             cursor.execute(query, parameters)
+            self._write_schedules(cursor, [loan])
+            self._apply_metrics_delta(cursor, loan.loan_id, 1)
             conn.commit()
             return True
             
@@ -335,6 +903,86 @@ class DbManager:
             if conn:
                 self.release_connection(conn)
 
+    def flush_dirty_loans(self, loans):
+        """
+        Salva in un'unica transazione le modifiche registrate dei prestiti (Loan.pending_changes):
+        anagrafiche con un solo UPDATE multi-riga ... FROM (VALUES ...), poi solo le voci
+        di costo cambiate e i piani dei prestiti i cui parametri sono cambiati.
+        Restituisce il numero di prestiti scritti.
+        """
+        pending = [(loan, loan.pending_changes()) for loan in loans]
+        pending = [(loan, changes) for loan, changes in pending if changes]
+        if not pending:
+            return 0
+
+        conn = None
+        cursor = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            for loan, changes in pending:
+                if changes.is_new:
+                    self._write_full_loan(cursor, loan)
+            pending_updates = [(loan, changes) for loan, changes in pending if not changes.is_new]
+
+            changed = [(loan, changes) for loan, changes in pending_updates if changes.fields or changes.schedule]
+            loan_ids = [loan.loan_id for loan, _ in changed]
+            if changed:
+                self._apply_metrics_delta(cursor, loan_ids, -1)
+                execute_values(cursor, """
+                    UPDATE loans AS l SET
+                        initial_rate = v.initial_rate, initial_term = v.initial_term,
+                        loan_amount = v.loan_amount, amortization_type = v.amortization_type,
+                        frequency = v.frequency, rate_type = v.rate_type, use_euribor = v.use_euribor,
+                        update_frequency = v.update_frequency, downpayment_percent = v.downpayment_percent,
+                        start_date = v.start_date, active = v.active,
+                        updated_at = CASE WHEN v.schedule THEN CURRENT_TIMESTAMP ELSE l.updated_at END
+                    FROM (VALUES %s) AS v(
+                        loan_id, initial_rate, initial_term, loan_amount, amortization_type, frequency,
+                        rate_type, use_euribor, update_frequency, downpayment_percent, start_date, active,
+                        schedule
+                    )
+                    WHERE l.loan_id = v.loan_id
+                    """,
+                    [
+                        (
+                            loan.loan_id, float(loan.initial_rate), int(loan.initial_term), float(loan.loan_amount),
+                            loan.amortization_type, loan.frequency, loan.rate_type, bool(loan.use_euribor),
+                            loan.update_frequency, float(loan.downpayment_percent), loan.start.date(),
+                            bool(loan.active), changes.schedule
+                        )
+                        for loan, changes in changed
+                    ],
+                    template="(%s::uuid, %s::numeric, %s::integer, %s::numeric, %s::varchar, %s::varchar, "
+                             "%s::varchar, %s::boolean, %s::varchar, %s::numeric, %s::date, %s::boolean, %s::boolean)",
+                    page_size=len(changed)
+                )
+
+            self._write_amount_changes(cursor, [changes for _, changes in pending_updates])
+
+            self._write_schedules(cursor, [loan for loan, changes in changed if changes.schedule])
+
+            if changed:
+                self._apply_metrics_delta(cursor, loan_ids, 1)
+            conn.commit()
+
+            for loan, _ in pending:
+                loan.mark_clean()
+            print(f"DEBUG: Salvati {len(pending)} prestiti modificati su {len(loans)}")
+            return len(pending)
+
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            print(f"Error flushing modified loans: {str(e)}")
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self.release_connection(conn)
+
     def check_connection(self):
         """Verifica che la connessione al database sia attiva"""
         conn = None
@@ -382,6 +1030,147 @@ class DbManager:
             if conn:
                 self.release_connection(conn)
 
+    def iter_all_loans_from_db(self, itersize=2000):
+        """Come load_all_loans_from_db, ma restituisce i prestiti uno alla volta con un cursore lato server."""
+        return self.stream_query("""
+            SELECT loan_id, initial_rate, initial_term, loan_amount, 
+                amortization_type, frequency, rate_type, use_euribor,
+                update_frequency, downpayment_percent, start_date, active
+            FROM loans 
+            ORDER BY start_date DESC
+            """, itersize=itersize)
+
+    def load_portfolio_aggregates(self):
+        """
+        Calcola in SQL le metriche di portafoglio: numero di prestiti, importo totale, tasso medio,
+        ripartizione per tipo di ammortamento e interessi totali dai piani salvati.
+
+        Un piano è considerato valido solo se esiste, ha tante rate quanti i periodi del prestito
+        ed è stato calcolato dopo l'ultima modifica del prestito; gli altri prestiti sono elencati
+        in 'stale_loan_ids' e vanno ricalcolati in Python.
+        Restituisce anche, per ogni prestito, gli input del TAEG (costi e spese già sommati).
+        """
+        conn = None
+        cursor = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute("""
+            SELECT amortization_type, COUNT(*), COALESCE(SUM(loan_amount), 0), AVG(initial_rate)
+            FROM loans
+            GROUP BY amortization_type
+            """)
+            by_type = {
+                row[0]: {'count': int(row[1]), 'amount': float(row[2]), 'avg_rate': float(row[3])}
+                for row in cursor.fetchall()
+            }
+
+            cursor.execute("""
+            SELECT COUNT(*), COALESCE(SUM(loan_amount), 0), AVG(initial_rate), AVG(initial_term) FROM loans
+            """)
+            total_loans, total_amount, avg_rate, avg_term = cursor.fetchone()
+
+            cursor.execute("""
+            WITH schedules AS (
+                SELECT loan_id, COUNT(*) AS payments, SUM(interest) AS interest
+                FROM amortization_schedule
+                GROUP BY loan_id
+            ), status AS (
+                SELECT l.loan_id, s.interest,
+                       s.loan_id IS NULL
+                       OR s.payments <> l.initial_term * CASE l.frequency
+                            WHEN 'monthly' THEN 12 WHEN 'quarterly' THEN 4
+                            WHEN 'semi-annual' THEN 2 ELSE 1 END
+                       OR l.schedule_updated_at IS NULL
+                       OR l.schedule_updated_at < l.updated_at AS stale
+                FROM loans l
+                LEFT JOIN schedules s ON s.loan_id = l.loan_id
+            )
+            SELECT COALESCE(SUM(interest) FILTER (WHERE NOT stale), 0),
+                   COALESCE(ARRAY_AGG(loan_id::text) FILTER (WHERE stale), '{}')
+            FROM status
+            """)
+            schedule_interest, stale_loan_ids = cursor.fetchone()
+
+            cursor.execute("""
+            SELECT l.loan_id, l.initial_rate, l.initial_term, l.loan_amount, l.frequency,
+                   l.rate_type, l.downpayment_percent,
+                   COALESCE(c.total, 0), COALESCE(e.total, 0)
+            FROM loans l
+            LEFT JOIN (SELECT loan_id, SUM(amount) AS total FROM additional_costs GROUP BY loan_id) c
+                ON c.loan_id = l.loan_id
+            LEFT JOIN (SELECT loan_id, SUM(amount) AS total FROM periodic_expenses GROUP BY loan_id) e
+                ON e.loan_id = l.loan_id
+            """)
+            taeg_inputs = cursor.fetchall()
+
+            return {
+                'total_loans': int(total_loans),
+                'total_amount': float(total_amount),
+                'avg_initial_rate': float(avg_rate) if avg_rate is not None else 0.0,
+                'avg_term': float(avg_term) if avg_term is not None else 0.0,
+                'by_amortization_type': by_type,
+                'schedule_interest': float(schedule_interest),
+                'stale_loan_ids': list(stale_loan_ids),
+                'taeg_inputs': taeg_inputs,
+            }
+
+        except Exception as e:
+            print(f"Error loading portfolio aggregates: {str(e)}")
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self.release_connection(conn)
+
+    def load_portfolio_metrics(self):
+        """
+        Legge le metriche di portafoglio mantenute in portfolio_metrics (una riga per
+        tipo di ammortamento e frequenza) e ne restituisce totali e ripartizioni.
+        """
+        result = self.execute_db_query("""
+            SELECT amortization_type, frequency, loan_count, total_amount,
+                   sum_rate, sum_term, total_interest
+            FROM portfolio_metrics
+            WHERE loan_count > 0
+        """)
+        groups = [
+            {
+                'amortization_type': row[0], 'frequency': row[1], 'count': int(row[2]),
+                'amount': float(row[3]), 'sum_rate': float(row[4]), 'sum_term': int(row[5]),
+                'interest': float(row[6]),
+            }
+            for row in result.fetchall()
+        ]
+        total_loans = sum(group['count'] for group in groups)
+        by_type = {}
+        for group in groups:
+            by_type[group['amortization_type']] = by_type.get(group['amortization_type'], 0) + group['count']
+        return {
+            'total_loans': total_loans,
+            'total_amount': sum(group['amount'] for group in groups),
+            'avg_initial_rate': sum(group['sum_rate'] for group in groups) / total_loans if total_loans else 0.0,
+            'avg_term': sum(group['sum_term'] for group in groups) / total_loans if total_loans else 0.0,
+            'total_interest': sum(group['interest'] for group in groups),
+            'count_by_amortization_type': by_type,
+            'groups': groups,
+        }
+
+    def load_loans_by_ids(self, loan_ids):
+        """Carica solo i prestiti indicati, con le stesse colonne di load_all_loans_from_db."""
+        if not loan_ids:
+            return []
+        result = self.execute_db_query("""
+            SELECT loan_id, initial_rate, initial_term, loan_amount, 
+                amortization_type, frequency, rate_type, use_euribor,
+                update_frequency, downpayment_percent, start_date, active
+            FROM loans 
+            WHERE loan_id = ANY(%s::uuid[])
+            """, ([str(loan_id) for loan_id in loan_ids],))
+        return result.fetchall()
+
     def load_additional_costs(self, loan_id):
         """Load additional costs for a loan"""
         conn = None
@@ -424,12 +1213,95 @@ class DbManager:
             if conn:
                 self.release_connection(conn)
                 
+    def load_all_loans_with_costs(self):
+        """
+        Carica prestiti, costi aggiuntivi e spese periodiche con tre query set-based
+        sulla stessa connessione.
+        Restituisce (loans, additional_costs, periodic_expenses), dove i due dizionari
+        sono indicizzati per loan_id e contengono {descrizione: importo}.
+        """
+        conn = None
+        cursor = None
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+            SELECT loan_id, initial_rate, initial_term, loan_amount, 
+                amortization_type, frequency, rate_type, use_euribor,
+                update_frequency, downpayment_percent, start_date, active
+            FROM loans 
+            ORDER BY start_date DESC
+            """)
+            loans = cursor.fetchall()
+            
+            grouped = []
+            for table in ("additional_costs", "periodic_expenses"):
+                cursor.execute(f"SELECT loan_id, description, amount FROM {table}")
+                by_loan = {}
+                for loan_id, description, amount in cursor.fetchall():
+                    by_loan.setdefault(str(loan_id), {})[description] = amount
+                grouped.append(by_loan)
+            
+            print(f"DEBUG: Prestiti trovati nel DB: {len(loans)}")
+            return loans, grouped[0], grouped[1]
+            
+        except Exception as e:
+            print(f"Error loading loans with costs: {str(e)}")
+            return [], {}, {}
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self.release_connection(conn)
+
     def close_all_connections(self):
         """Close all connections in the pool"""
         if self._pool is not None:
             self._pool.closeall()
             print("All database connections closed")
 
+class AsyncDbManager:
+    """
+    Facciata asincrona di DbManager: ogni chiamata viene eseguita su un pool di thread
+    dedicato e restituisce subito un concurrent.futures.Future, così la UI non resta
+    bloccata sulla latenza di rete.
+
+    I metodi di DbManager sono esposti con lo stesso nome (async_db.load_all_loans_with_costs()
+    restituisce un Future); submit() esegue qualunque funzione che usi il database
+    (es. metodi di LoanCRM o LoanReport) e run_async() permette di attenderla da asyncio.
+    """
+
+    def __init__(self, db_manager, max_workers=None):
+        self.db_manager = db_manager
+        # Più thread delle connessioni disponibili resterebbero solo in attesa del pool
+        self.max_workers = max_workers or max(1, min(8, db_manager.max_connections))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="db")
+
+    def submit(self, func, *args, **kwargs):
+        """Esegue func(*args, **kwargs) in background e restituisce il Future del risultato."""
+        return self._executor.submit(func, *args, **kwargs)
+
+    async def run_async(self, func, *args, **kwargs):
+        """Versione awaitable di submit, da usare all'interno di un event loop asyncio."""
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def __getattr__(self, name):
+        attribute = getattr(self.db_manager, name)
+        if not callable(attribute):
+            return attribute
+
+        def call_in_background(*args, **kwargs):
+            return self.submit(attribute, *args, **kwargs)
+
+        call_in_background.__name__ = name
+        call_in_background.__doc__ = attribute.__doc__
+        return call_in_background
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
 # JIT-compiled function for calculating default probability
 @nb.jit(nopython=True)
 def _calculate_default_probability(loan_life, initial_default, default_decay, final_default, recovery_rate):
@@ -485,143 +1357,384 @@ def _calculate_adjusted_cashflow(default_probs, cashflows, loan_amount, period_r
     
     return adjusted_flows
 
-# JIT-compiled function to generate multiple payment streams efficiently
+# JIT-compiled function to generate all payment streams in one contiguous buffer
 @nb.jit(nopython=True)
-def _generate_payment_streams(loan_amount, rates, terms, amortization_type, periods_per_year):
-    """Generate payment streams for all combinations of rates and terms"""
-    result = {}
-    
-    for rate in rates:
-        for term in terms:
-            periods = term * periods_per_year
-            period_rate = rate / periods_per_year
-            
-            if amortization_type == "French":
+def _build_payment_buffer(loan_amount, rates, terms, amortization_type_code, periods_per_year):
+    """
+    Genera i flussi di rata per tutte le combinazioni (tasso, durata) in un unico buffer.
+    Il flusso della combinazione (rate_idx, life_idx) occupa
+    buffer[offsets[k]:offsets[k + 1]] con k = rate_idx * len(terms) + life_idx.
+    """
+    rate_count = len(rates)
+    life_count = len(terms)
+    offsets = np.zeros(rate_count * life_count + 1, dtype=np.int64)
+    for r in range(rate_count):
+        for t in range(life_count):
+            k = r * life_count + t
+            offsets[k + 1] = offsets[k] + terms[t] * periods_per_year
+
+    buffer = np.empty(offsets[-1])
+    for r in range(rate_count):
+        period_rate = rates[r] / periods_per_year
+        for t in range(life_count):
+            start = offsets[r * life_count + t]
+            periods = terms[t] * periods_per_year
+
+            if amortization_type_code == 0:
                 # French amortization (constant payment)
                 payment = abs(loan_amount * period_rate / (1 - (1 + period_rate)**(-periods)))
-                payments = np.full(periods, payment)
+                for i in range(periods):
+                    buffer[start + i] = payment
             else:  # Italian
                 # Italian amortization (constant principal)
                 principal = loan_amount / periods
-                payments = np.zeros(periods)
                 remaining = loan_amount
                 for i in range(periods):
                     interest = remaining * period_rate
-                    payments[i] = principal + interest
+                    buffer[start + i] = principal + interest
                     remaining -= principal
-                    
-            key = (rate, term)
-            result[key] = payments
-            
-    return result
 
-@nb.jit(nopython=True, parallel=True)
+    return buffer, offsets
+
+@nb.jit(nopython=True)
+def _evaluate_pricing_grid(
+    loan_amount, interest_rates_array, loan_lives_array, default_probabilities_array,
+    payment_buffer, payment_offsets, default_decay, final_default, recovery_rate, periods_per_year
+):
+    """
+    IRR atteso per ogni combinazione (tasso, durata, probabilità di default) nel modello
+    deterministico: nessuna estrazione casuale, quindi una sola valutazione per combinazione.
+    Le combinazioni senza IRR valido restano NaN.
+    """
+    rate_count = len(interest_rates_array)
+    life_count = len(loan_lives_array)
+    prob_count = len(default_probabilities_array)
+    irr_grid = np.full((rate_count, life_count, prob_count), np.nan)
+
+    for rate_idx in range(rate_count):
+        rate = interest_rates_array[rate_idx]
+        for life_idx in range(life_count):
+            life = loan_lives_array[life_idx]
+            stream = rate_idx * life_count + life_idx
+            cashflows = payment_buffer[payment_offsets[stream]:payment_offsets[stream + 1]]
+
+            for prob_idx in range(prob_count):
+                probs = _calculate_default_probability(
+                    life, default_probabilities_array[prob_idx], default_decay, final_default, recovery_rate
+                )
+                adj_flows = _calculate_adjusted_cashflow(
+                    probs, cashflows, loan_amount, rate/periods_per_year, recovery_rate
+                )
+                irr = _calculate_simple_irr(adj_flows, 0.05, 100)
+                if not np.isnan(irr) and abs(irr) < 1.0:  # Valid IRR
+                    irr_grid[rate_idx, life_idx, prob_idx] = irr
+
+    return irr_grid
+
+@nb.jit(nopython=True, nogil=True, cache=True)
+def _splitmix64(z):
+    z = z + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+@nb.jit(nopython=True, nogil=True, cache=True)
+def _iteration_seed(seed, iteration):
+    """
+    Seed a 32 bit dell'iterazione, mescolando seed e indice con splitmix64: seed vicini
+    (es. 7 e 8) danno percorsi indipendenti invece degli stessi percorsi sfasati.
+    """
+    z = _splitmix64(_splitmix64(np.uint64(seed)) ^ np.uint64(iteration))
+    return np.int64(z >> np.uint64(32))
+
+@nb.jit(nopython=True, nogil=True, cache=True)
 def _process_simulation_batch(
     loan_amount, interest_rates_array, loan_lives_array, default_probabilities_array, 
-    payment_streams_keys, payment_streams_values, 
-    num_iterations, initial_default, default_decay, final_default, recovery_rate, 
-    periods_per_year, batch_start, batch_end
+    payment_buffer, payment_offsets, 
+    default_decay, final_default, recovery_rate, recovery_concentration,
+    periods_per_year, batch_start, batch_end, seed
 ):
-    """JIT-compiled function to process a batch of simulations"""
-    # Pre-allocate result arrays
+    """
+    Simulazioni stocastiche delle iterazioni [batch_start, batch_end), ciascuna su tutte le
+    combinazioni (tasso, durata, probabilità di default).
+    Ogni simulazione estrae il periodo di default (probabilità annue della curva di default
+    convertite in probabilità per periodo) e, in caso di default, il tasso di recupero sul
+    debito residuo da una Beta con media recovery_rate; l'IRR del percorso è annualizzato.
+    Restituisce l'IRR di ogni (iterazione, tasso, durata, probabilità), NaN se non valido.
+    Con seed >= 0 ogni iterazione riparte da un seed derivato da seed e dal proprio indice
+    (_iteration_seed): il risultato non dipende da come le iterazioni sono divise in batch,
+    né dal thread o dal processo che le esegue.
+    Rilascia il GIL: più thread possono eseguire batch diversi in parallelo.
+    """
     rate_count = len(interest_rates_array)
     life_count = len(loan_lives_array)
     prob_count = len(default_probabilities_array)
     
-    local_sum = np.zeros((rate_count, life_count, prob_count))
-    local_count = np.zeros((rate_count, life_count, prob_count), dtype=np.int32)
+    samples = np.full((batch_end - batch_start, rate_count, life_count, prob_count), np.nan)
+
+    # Parametri della Beta per il recupero (concentrazione <= 0: recupero fisso)
+    beta_a = recovery_rate * recovery_concentration
+    beta_b = (1.0 - recovery_rate) * recovery_concentration
+    sample_recovery = recovery_concentration > 0 and 0.0 < recovery_rate < 1.0
+
+    flows = np.empty(loan_lives_array.max() * periods_per_year + 1)
     
-    for i in range(batch_start, batch_end):
-        # Fast index calculation
-        iter_idx = i % num_iterations
-        param_idx = i // num_iterations
-        
-        rate_idx = param_idx % rate_count
-        param_idx //= rate_count
-        prob_idx = param_idx % prob_count
-        life_idx = param_idx // prob_count
-        
-        if life_idx >= life_count:
-            continue
-            
-        rate = interest_rates_array[rate_idx]
-        default_prob = default_probabilities_array[prob_idx]
-        life = loan_lives_array[life_idx]
-        
-        # Find the right payment stream in the flattened arrays
-        payment_idx = -1
-        for j in range(len(payment_streams_keys)):
-            if (abs(payment_streams_keys[j][0] - rate) < 1e-10 and 
-                payment_streams_keys[j][1] == life):
-                payment_idx = j
-                break
-                
-        if payment_idx == -1:
-            continue
+    for iteration in range(batch_start, batch_end):
+        if seed >= 0:
+            np.random.seed(_iteration_seed(seed, iteration))
+        row = iteration - batch_start
+        
+        for param_idx in range(rate_count * prob_count * life_count):
+            rate_idx = param_idx % rate_count
+            prob_idx = (param_idx // rate_count) % prob_count
+            life_idx = param_idx // (rate_count * prob_count)
             
-        cashflows = payment_streams_values[payment_idx]
+            rate = interest_rates_array[rate_idx]
+            life = loan_lives_array[life_idx]
+            period_rate = rate / periods_per_year
         
-        # Calculate probabilities and adjusted cashflows
-        probs = _calculate_default_probability(
-            life, default_prob, default_decay, final_default, recovery_rate
-        )
+            # Accesso diretto al flusso di rate della combinazione (tasso, durata)
+            stream = rate_idx * life_count + life_idx
+            cashflows = payment_buffer[payment_offsets[stream]:payment_offsets[stream + 1]]
         
-        adj_flows = _calculate_adjusted_cashflow(
-            probs, cashflows, loan_amount, rate/periods_per_year, recovery_rate
-        )
+            # Curva annua di default: i primi `life` valori sono le probabilità di ciascun anno
+            probs = _calculate_default_probability(
+                life, default_probabilities_array[prob_idx], default_decay, final_default, recovery_rate
+            )
         
-        # Calculate IRR
-        try:
-            # Simple IRR calculation for nopython mode
-            irr = _calculate_simple_irr(adj_flows, 0.05, 100)
-            if not np.isnan(irr) and abs(irr) < 1.0:  # Valid IRR
-                local_sum[rate_idx, life_idx, prob_idx] += irr
-                local_count[rate_idx, life_idx, prob_idx] += 1
-        except:
-            pass
+            # Percorso simulato: erogazione, rate fino all'eventuale default, recupero sul residuo
+            flows[0] = -loan_amount
+            balance = loan_amount
+            n_flows = len(cashflows) + 1
+            for k in range(len(cashflows)):
+                period_default = 1.0 - (1.0 - probs[k // periods_per_year]) ** (1.0 / periods_per_year)
+                if np.random.random() < period_default:
+                    recovery = np.random.beta(beta_a, beta_b) if sample_recovery else recovery_rate
+                    flows[k + 1] = recovery * balance
+                    n_flows = k + 2
+                    break
+                flows[k + 1] = cashflows[k]
+                balance -= cashflows[k] - balance * period_rate
+        
+            period_irr = _calculate_simple_irr(flows[:n_flows], period_rate, 100)
+            if np.isnan(period_irr):
+                continue
+            irr = (1.0 + period_irr) ** periods_per_year - 1.0
+            if abs(irr) < 1.0:  # Valid IRR
+                samples[row, rate_idx, life_idx, prob_idx] = irr
             
-    return local_sum, local_count
+    return samples
+
+@nb.jit(nopython=True, parallel=True, cache=True)
+def _process_simulation_batches_prange(
+    loan_amount, interest_rates_array, loan_lives_array, default_probabilities_array,
+    payment_buffer, payment_offsets,
+    default_decay, final_default, recovery_rate, recovery_concentration,
+    periods_per_year, batch_starts, batch_ends, seed
+):
+    """Esegue più batch consecutivi con prange sul pool di thread di numba; IRR di ogni iterazione."""
+    first = batch_starts[0]
+    samples = np.empty((batch_ends[-1] - first, len(interest_rates_array),
+                        len(loan_lives_array), len(default_probabilities_array)))
+
+    for b in nb.prange(len(batch_starts)):
+        samples[batch_starts[b] - first:batch_ends[b] - first] = _process_simulation_batch(
+            loan_amount, interest_rates_array, loan_lives_array, default_probabilities_array,
+            payment_buffer, payment_offsets,
+            default_decay, final_default, recovery_rate, recovery_concentration,
+            periods_per_year, batch_starts[b], batch_ends[b], seed
+        )
 
-@nb.jit(nopython=True)
-def _calculate_simple_irr(cashflows, guess=0.1, max_iterations=100):
-    """Simple IRR implementation compatible with Numba nopython mode"""
-    rate = guess
-    
-    for _ in range(max_iterations):
-        npv = 0.0
-        der = 0.0
-        
-        for i in range(len(cashflows)):
-            npv += cashflows[i] / (1 + rate) ** i
-            der += -i * cashflows[i] / (1 + rate) ** (i + 1)
-            
-        if abs(npv) < 1e-6:
-            return rate
-            
-        if abs(der) < 1e-10:
+    return samples
+
+@nb.jit(nopython=True, cache=True)
+def _accumulate_simulation_samples(sum_irr, count_irr, samples):
+    """Somma gli IRR validi di un batch ai totali, un'iterazione alla volta nell'ordine del batch."""
+    for row in range(samples.shape[0]):
+        for r in range(samples.shape[1]):
+            for l in range(samples.shape[2]):
+                for p in range(samples.shape[3]):
+                    irr = samples[row, r, l, p]
+                    if not np.isnan(irr):
+                        sum_irr[r, l, p] += irr
+                        count_irr[r, l, p] += 1
+
+# Pool di processi per il pricing, creato al primo uso e riutilizzato tra le chiamate
+# (l'avvio dei processi e il caricamento dei kernel costano più di un batch)
+_pricing_process_pool = None
+_pricing_process_pool_size = 0
+_pricing_process_pool_lock = threading.Lock()
+
+def _get_pricing_process_pool(max_workers):
+    global _pricing_process_pool, _pricing_process_pool_size
+    with _pricing_process_pool_lock:
+        if _pricing_process_pool is None or _pricing_process_pool_size != max_workers:
+            if _pricing_process_pool is not None:
+                _pricing_process_pool.shutdown(wait=True)
+            # spawn: i processi figli non ereditano i thread di Qt e di numba del processo principale
+            _pricing_process_pool = ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')
+            )
+            _pricing_process_pool_size = max_workers
+        return _pricing_process_pool
+
+def shutdown_pricing_process_pool():
+    """Chiude il pool di processi del pricing, se è stato avviato."""
+    global _pricing_process_pool, _pricing_process_pool_size
+    with _pricing_process_pool_lock:
+        if _pricing_process_pool is not None:
+            _pricing_process_pool.shutdown(wait=True)
+            _pricing_process_pool = None
+            _pricing_process_pool_size = 0
+
+def _run_pricing_batch_in_process(kernel_args, start, end, seed):
+    """Esegue un batch in un processo del pool e ne restituisce gli IRR."""
+    return _process_simulation_batch(*kernel_args, start, end, seed)
+
+# Esito della ricerca dell'IRR per ciascun vettore di flussi (solve_irr_batch)
+IRR_NEWTON = 0      # convergenza con il metodo di Newton
+IRR_BISECTION = 1   # convergenza con la bisezione su un intervallo con cambio di segno
+IRR_FAILED = 2      # nessuna radice trovata nell'intervallo di ricerca
+
+@nb.jit(nopython=True, nogil=True, cache=True)
+def _npv_and_derivative(cashflows, length, rate):
+    """VAN e derivata rispetto al tasso; le potenze di 1/(1+r) sono calcolate come prodotto cumulativo."""
+    v = 1.0 / (1.0 + rate)
+    discount = 1.0
+    npv = 0.0
+    derivative = 0.0
+    for t in range(length):
+        npv += cashflows[t] * discount
+        derivative -= t * cashflows[t] * discount * v
+        discount *= v
+    return npv, derivative
+
+@nb.jit(nopython=True, nogil=True, cache=True)
+def _npv_sign(cashflows, length, rate):
+    """
+    Valore con lo stesso segno del VAN, senza overflow sui vettori lunghi: per r < 0 il VAN
+    è moltiplicato per (1+r)^(length-1) (schema di Horner), così tutte le potenze sono <= 1.
+    """
+    if rate >= 0.0:
+        return _npv_and_derivative(cashflows, length, rate)[0]
+    growth = 1.0 + rate
+    value = 0.0
+    for t in range(length):
+        value = value * growth + cashflows[t]
+    return value
+
+@nb.jit(nopython=True, nogil=True, cache=True)
+def _solve_irr(cashflows, length, guess, tol, max_iter, lower, upper):
+    """
+    IRR dei primi `length` flussi: Newton a partire da guess, con i passi che escono da
+    (lower, upper) fermati a metà strada dal limite, e, se non converge, bisezione sul primo
+    intervallo con cambio di segno del VAN più vicino a guess.
+    Ritorna (tasso, esito) con esito IRR_NEWTON, IRR_BISECTION o IRR_FAILED.
+    """
+    rate = min(max(guess, lower), upper)
+    for _ in range(max_iter):
+        npv, derivative = _npv_and_derivative(cashflows, length, rate)
+        if derivative == 0.0 or not np.isfinite(npv) or not np.isfinite(derivative):
             break
-            
-        rate = rate - npv / der
-        
-        if rate <= -1.0:
-            return np.nan
-            
-    return rate if -1.0 < rate < 100.0 else np.nan
+        step = npv / derivative
+        new_rate = rate - step
+        if not np.isfinite(new_rate):
+            break
+        damped = new_rate <= lower or new_rate >= upper
+        if new_rate <= lower:
+            new_rate = 0.5 * (rate + lower)
+        elif new_rate >= upper:
+            new_rate = 0.5 * (rate + upper)
+        rate = new_rate
+        if not damped and abs(step) <= tol * (1.0 + abs(rate)):
+            return rate, IRR_NEWTON
+
+    # Fallback: griglia di tassi in [lower, upper] per trovare un cambio di segno del VAN
+    # (valutato con _npv_sign: l'overflow non può nascondere i tassi bassi)
+    n_grid = 64
+    best_low = np.nan
+    best_high = np.nan
+    best_distance = np.inf
+    prev_rate = lower
+    prev_npv = _npv_sign(cashflows, length, lower)
+    for g in range(1, n_grid + 1):
+        grid_rate = lower + (upper - lower) * g / n_grid
+        grid_npv = _npv_sign(cashflows, length, grid_rate)
+        if np.isfinite(prev_npv) and np.isfinite(grid_npv) and prev_npv * grid_npv <= 0.0:
+            distance = min(abs(prev_rate - guess), abs(grid_rate - guess))
+            if distance < best_distance:
+                best_distance = distance
+                best_low = prev_rate
+                best_high = grid_rate
+        prev_rate = grid_rate
+        prev_npv = grid_npv
+
+    if np.isnan(best_low):
+        return np.nan, IRR_FAILED
+
+    low = best_low
+    high = best_high
+    low_npv = _npv_sign(cashflows, length, low)
+    if low_npv == 0.0:
+        return low, IRR_BISECTION
+    for _ in range(200):
+        mid = 0.5 * (low + high)
+        mid_npv = _npv_sign(cashflows, length, mid)
+        if mid_npv == 0.0 or (high - low) <= tol * (1.0 + abs(mid)):
+            return mid, IRR_BISECTION
+        if low_npv * mid_npv < 0.0:
+            high = mid
+        else:
+            low = mid
+            low_npv = mid_npv
+    return 0.5 * (low + high), IRR_BISECTION
 
-@nb.jit(nopython=True)
-def _flatten_payment_streams(rates, terms, payment_dict):
-    """Convert dictionary to arrays for numba compatibility"""
-    keys = []
-    values = []
-    
-    for r in rates:
-        for t in terms:
-            key = (r, t)
-            if key in payment_dict:
-                keys.append(key)
-                values.append(payment_dict[key])
-                
-    return keys, values
+@nb.jit(nopython=True, nogil=True, cache=True)
+def _calculate_simple_irr(cashflows, guess=0.1, max_iterations=100):
+    """IRR di un vettore di flussi compatibile con numba nopython (NaN se non trovato)."""
+    return _solve_irr(cashflows, len(cashflows), guess, 1e-12, max_iterations, -0.99, 100.0)[0]
+
+@nb.jit(nopython=True, parallel=True, cache=True)
+def _solve_irr_rows(cashflows, lengths, guesses, tol, max_iter, lower, upper):
+    """Risolve in parallelo l'IRR di ogni riga di una matrice di flussi allineati a sinistra."""
+    n = cashflows.shape[0]
+    rates = np.empty(n)
+    status = np.empty(n, dtype=np.int8)
+    for i in nb.prange(n):
+        rates[i], status[i] = _solve_irr(cashflows[i], lengths[i], guesses[i], tol, max_iter, lower, upper)
+    return rates, status
+
+def solve_irr_batch(cashflows, lengths=None, guess=0.1, tol=1e-12, max_iter=100, lower=-0.99, upper=100.0):
+    """
+    Risolve l'IRR periodico di molti vettori di flussi contemporaneamente.
+
+    cashflows può essere una matrice (un vettore per riga, con lengths che indica quanti flussi
+    di ciascuna riga usare) oppure una lista di vettori di lunghezza diversa, che viene
+    allineata in una matrice con zeri in coda (gli zeri non cambiano il VAN).
+    guess può essere uno scalare o un valore per vettore.
+
+    Ogni vettore è risolto con Newton (potenze di sconto per prodotto cumulativo, passi
+    limitati a (lower, upper)) e, se non converge, con la bisezione su un intervallo di
+    [lower, upper] con cambio di segno del VAN.
+    Ritorna (tassi, esiti): NaN e IRR_FAILED dove non è stata trovata una radice.
+    """
+    if isinstance(cashflows, np.ndarray) and cashflows.ndim == 2:
+        matrix = np.ascontiguousarray(cashflows, dtype=np.float64)
+        if lengths is None:
+            lengths = np.full(matrix.shape[0], matrix.shape[1], dtype=np.int64)
+    else:
+        rows = [np.asarray(row, dtype=np.float64).ravel() for row in cashflows]
+        width = max((row.size for row in rows), default=0)
+        matrix = np.zeros((len(rows), width))
+        for i, row in enumerate(rows):
+            matrix[i, :row.size] = row
+        if lengths is None:
+            lengths = np.array([row.size for row in rows], dtype=np.int64)
+    lengths = np.minimum(np.asarray(lengths, dtype=np.int64).ravel(), matrix.shape[1])
+    guesses = np.broadcast_to(np.asarray(guess, dtype=np.float64), lengths.shape).copy()
+    if matrix.shape[0] == 0:
+        return np.empty(0), np.empty(0, dtype=np.int8)
+    return _solve_irr_rows(matrix, lengths, guesses, float(tol), int(max_iter), float(lower), float(upper))
 
 # Funzioni JIT compilate per l'efficienza computazionale
 @nb.jit(nopython=True)
@@ -686,10 +1799,564 @@ def _mc_run_simulations(
     
     return results
 
+def _amortization_arrays(loan_amount, period_rate, periods, period_index, amortization_type):
+    """
+    Calcola in forma chiusa le colonne del piano di ammortamento a tasso fisso.
+
+    Tutti gli argomenti numerici sono broadcastabili tra loro: per un singolo prestito
+    period_index è np.arange(periods), per un portafoglio sono array piatti allineati.
+
+    Ritorna la tupla (initial_debt, payment, interest, principal, balance) di array float64.
+    """
+    loan_amount = np.asarray(loan_amount, dtype=np.float64)
+    period_rate = np.asarray(period_rate, dtype=np.float64)
+    periods = np.asarray(periods, dtype=np.float64)
+    k = np.asarray(period_index, dtype=np.float64)
+
+    if amortization_type == "French":
+        # Rata costante: B_k = P(1+r)^k - PMT((1+r)^k - 1)/r
+        zero_rate = period_rate == 0
+        safe_rate = np.where(zero_rate, 1.0, period_rate)
+        growth = (1 + period_rate) ** k
+        annuity = (1 + period_rate) ** periods
+        payment = np.where(zero_rate, loan_amount / periods,
+                           loan_amount * safe_rate * annuity / np.where(zero_rate, 1.0, annuity - 1))
+        initial_debt = np.where(zero_rate, loan_amount - payment * k,
+                                loan_amount * growth - payment * (growth - 1) / safe_rate)
+        payment = payment + np.zeros_like(k)
+        interest = initial_debt * period_rate
+        principal = payment - interest
+    elif amortization_type == "Italian":
+        # Quota capitale costante: il debito residuo decresce linearmente
+        principal = loan_amount / periods + np.zeros_like(k)
+        initial_debt = loan_amount - principal * k
+        interest = initial_debt * period_rate
+        payment = principal + interest
+    else:
+        raise ValueError("Unsupported amortization type")
+
+    balance = initial_debt - principal
+    return initial_debt, payment, interest, principal, balance
+
+def _variable_rate_schedule_arrays(loan_amount, rates, amortization_type):
+    """
+    Piano di ammortamento con rata ricalcolata ad ogni periodo in base al tasso corrente.
+
+    rates ha forma (periods,) per un singolo percorso oppure (n_paths, periods) per un insieme
+    di scenari: tutti i percorsi vengono calcolati insieme, senza cicli Python sui periodi.
+
+    Ritorna la tupla (initial_debt, payment, interest, principal, balance) con la forma di rates.
+    """
+    rates = np.asarray(rates, dtype=np.float64)
+    periods = rates.shape[-1]
+    remaining = np.arange(periods, 0, -1, dtype=np.float64)
+
+    if amortization_type == "French":
+        # Rata = B_i * r / (1 - (1+r)^-(n-i)), quindi B_{i+1} = B_i * (1 + r - fattore_rata)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            payment_factor = np.where(rates == 0, 1.0 / remaining,
+                                      rates / (1 - (1 + rates) ** -remaining))
+        growth = 1 + rates - payment_factor
+        initial_debt = np.empty_like(rates)
+        initial_debt[..., 0] = loan_amount
+        initial_debt[..., 1:] = loan_amount * np.cumprod(growth[..., :-1], axis=-1)
+        interest = initial_debt * rates
+        principal = initial_debt * payment_factor - interest
+    elif amortization_type == "Italian":
+        # La quota capitale è costante per definizione
+        principal = np.full_like(rates, loan_amount / periods)
+        initial_debt = loan_amount - principal * (periods - remaining)
+        interest = initial_debt * rates
+    else:
+        raise ValueError("Unsupported amortization type")
+
+    # L'ultima quota capitale chiude il piano esattamente a zero
+    principal[..., -1] = initial_debt[..., -1]
+    payment = interest + principal
+    balance = initial_debt - principal
+    balance[..., -1] = 0.0
+    return initial_debt, payment, interest, principal, balance
+
+def solve_taeg_batch(net_amounts, gross_payments, periods, periods_per_year, tol=1e-12, max_iter=100,
+                     chunk_size=2 ** 20):
+    """
+    Risolve il TAEG periodico di molti prestiti contemporaneamente.
+
+    Per ciascun prestito cerca r in [0, 1] tale che
+        sum_{i=1..n} gross / (1 + r)^(i / periods_per_year) = net
+    Con q = (1 + r)^(1 / periods_per_year) - 1 è l'IRR periodico dei flussi
+    [-net, gross, ..., gross]: i prestiti sono risolti con lo stesso motore di solve_irr_batch
+    (Newton e bisezione di _solve_irr) con q in [0, 2^(1/periods_per_year) - 1], raggruppati
+    per durata e frequenza in matrici di al più chunk_size flussi.
+
+    Ritorna un ndarray di tassi (NaN dove non esiste una soluzione in [0, 1]).
+    """
+    net = np.asarray(net_amounts, dtype=np.float64).ravel()
+    gross = np.asarray(gross_payments, dtype=np.float64).ravel()
+    n_periods = np.asarray(periods, dtype=np.int64).ravel()
+    ppy = np.asarray(periods_per_year, dtype=np.int64).ravel()
+    result = np.full(net.shape, np.nan)
+    if net.size == 0:
+        return result
+
+    for n, p in np.unique(np.stack([n_periods, ppy], axis=1), axis=0):
+        group = np.flatnonzero((n_periods == n) & (ppy == p))
+        upper = 2.0 ** (1.0 / p) - 1.0  # r = 1
+        rows = max(1, chunk_size // (int(n) + 1))  # limita la memoria della matrice dei flussi
+        for start in range(0, group.size, rows):
+            chunk = group[start:start + rows]
+            flows = np.empty((chunk.size, n + 1))
+            flows[:, 0] = -net[chunk]
+            flows[:, 1:] = gross[chunk, None]
+            period_rates, status = _solve_irr_rows(
+                flows, np.full(chunk.size, n + 1, dtype=np.int64), np.zeros(chunk.size),
+                float(tol), int(max_iter), 0.0, upper
+            )
+            solved = status != IRR_FAILED
+            result[chunk[solved]] = (1.0 + period_rates[solved]) ** p - 1.0
+    return result
+
+def portfolio_taeg(taeg_inputs, loans_by_id=None):
+    """
+    TAEG (periodico e annualizzato, in percentuale) di un intero portafoglio a partire dalle
+    righe 'taeg_inputs' di DbManager.load_portfolio_aggregates, in un'unica risoluzione.
+    La rata dei prestiti è calcolata in blocco dai termini contrattuali; per i prestiti presenti
+    in loans_by_id (es. variabili indicizzati all'Euribor) si usano importo e rata del Loan.
+    I prestiti senza soluzione sono esclusi dal risultato.
+    """
+    if not taeg_inputs:
+        return np.array([]), np.array([])
+    loans_by_id = loans_by_id or {}
+
+    rates = np.array([float(row[1]) for row in taeg_inputs])
+    terms = np.array([int(row[2]) for row in taeg_inputs])
+    amounts = np.array([float(row[3]) for row in taeg_inputs])
+    periods_per_year = np.array([_PERIODS_PER_YEAR[row[4]] for row in taeg_inputs])
+    downpayments = np.array([float(row[6]) for row in taeg_inputs])
+    initial_costs = np.array([float(row[7]) for row in taeg_inputs])
+    periodic_costs = np.array([float(row[8]) for row in taeg_inputs])
+
+    periods = terms * periods_per_year
+    financed = amounts - amounts * (downpayments / 100)
+    payments = np.abs(npf.pmt(rates / periods_per_year, periods, financed))
+    for i, row in enumerate(taeg_inputs):
+        loan = loans_by_id.get(str(row[0]))
+        if loan is not None:
+            financed[i] = loan.loan_amount
+            payments[i] = loan.pmt
+
+    period_rates = solve_taeg_batch(
+        financed - initial_costs, payments + periodic_costs, periods, periods_per_year
+    )
+    solved = ~np.isnan(period_rates)
+    period_rates = period_rates[solved]
+    annualized = (1 + period_rates) ** periods_per_year[solved] - 1
+    return period_rates * 100, annualized * 100
+
+
+_PERIODS_PER_YEAR = {'monthly': 12, 'quarterly': 4, 'semi-annual': 2, 'annual': 1}
+_MONTHS_PER_PERIOD = {'monthly': 1, 'quarterly': 3, 'semi-annual': 6, 'annual': 12}
+
+@lru_cache(maxsize=4096)
+def _payment_calendar(start, frequency, periods):
+    """
+    Date di pagamento di un piano come DatetimeIndex (immutabile e condiviso tra i prestiti
+    con stessa data di inizio, frequenza e numero di periodi).
+
+    Equivale a [start + relativedelta(months=step * x) for x in range(periods)]: il giorno
+    viene limitato all'ultimo giorno del mese quando necessario (es. 31 gennaio -> 29 febbraio).
+    """
+    step = _MONTHS_PER_PERIOD.get(frequency)
+    if step is None:
+        raise ValueError("Unsupported frequency")
+
+    start = pd.Timestamp(start)
+    months = np.datetime64(start.strftime('%Y-%m'), 'M') + np.arange(periods) * step
+    month_starts = months.astype('datetime64[D]')
+    days_in_month = ((months + 1).astype('datetime64[D]') - month_starts).astype(np.int64)
+    dates = month_starts + (np.minimum(start.day, days_in_month) - 1)
+    return pd.DatetimeIndex(dates.astype('datetime64[ns]')) + (start - start.normalize())
+
+class PortfolioSchedules:
+    """
+    Piani di ammortamento a tasso fisso di un intero portafoglio, calcolati in un solo passaggio.
+
+    I valori sono memorizzati in layout ragged: un array piatto per colonna e un array di
+    offsets, per cui il piano del prestito i occupa l'intervallo offsets[i]:offsets[i + 1].
+    """
+    COLUMNS = ('Initial Debt', 'Payment', 'Interest', 'Principal', 'Balance')
+
+    def __init__(self, loan_ids, offsets, columns, start_dates, frequencies):
+        self.loan_ids = loan_ids
+        self.offsets = offsets
+        self.columns = columns
+        self.start_dates = start_dates
+        self.frequencies = frequencies
+        self._positions = {loan_id: i for i, loan_id in enumerate(loan_ids)}
+
+    @classmethod
+    def from_db_rows(cls, loans_data):
+        """
+        Costruisce i piani a partire dalle righe di DbManager.load_all_loans_from_db.
+        I prestiti a tasso variabile vengono ignorati.
+        """
+        rows = [row for row in loans_data if row[6] == 'fixed']
+        n_loans = len(rows)
+
+        loan_ids = [str(row[0]) for row in rows]
+        frequencies = np.array([row[5] for row in rows], dtype=object)
+        amortization_types = np.array([row[4] for row in rows], dtype=object)
+        start_dates = [row[10] for row in rows]
+        periods_per_year = np.array([_PERIODS_PER_YEAR[f] for f in frequencies], dtype=np.int64)
+
+        # Stessa logica di Loan.__init__: l'anticipo viene scalato dall'importo
+        amounts = np.array([float(row[3]) for row in rows], dtype=np.float64)
+        downpayments = np.array([float(row[9]) for row in rows], dtype=np.float64)
+        amounts = amounts - amounts * downpayments / 100
+        rates = np.array([float(row[1]) for row in rows], dtype=np.float64) / np.maximum(periods_per_year, 1)
+        lengths = np.array([int(row[2]) for row in rows], dtype=np.int64) * periods_per_year
+
+        offsets = np.zeros(n_loans + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        total = int(offsets[-1])
+        columns = {name: np.empty(total, dtype=np.float64) for name in cls.COLUMNS}
+
+        for frequency in np.unique(frequencies) if n_loans else []:
+            for amortization_type in ("French", "Italian"):
+                group = np.flatnonzero((frequencies == frequency) & (amortization_types == amortization_type))
+                if group.size == 0:
+                    continue
+                group_lengths = lengths[group]
+                group_starts = offsets[group]
+                # Indice del periodo all'interno di ciascun prestito del gruppo
+                local_offsets = np.cumsum(group_lengths) - group_lengths
+                k = np.arange(int(group_lengths.sum())) - np.repeat(local_offsets, group_lengths)
+                positions = np.repeat(group_starts, group_lengths) + k
+
+                values = _amortization_arrays(
+                    np.repeat(amounts[group], group_lengths),
+                    np.repeat(rates[group], group_lengths),
+                    np.repeat(lengths[group], group_lengths),
+                    k,
+                    amortization_type
+                )
+                for name, column in zip(cls.COLUMNS, values):
+                    columns[name][positions] = np.round(column, 2)
+
+        return cls(loan_ids, offsets, columns, start_dates, frequencies)
+
+    def __len__(self):
+        return len(self.loan_ids)
+
+    def __contains__(self, loan_id):
+        return str(loan_id) in self._positions
+
+    def schedule(self, loan_id):
+        """Ritorna le colonne del piano di un prestito come viste (senza copia) sugli array piatti."""
+        i = self._positions[str(loan_id)]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return {name: column[start:end] for name, column in self.columns.items()}
+
+    def payment_dates(self, loan_id):
+        """Date di pagamento di un prestito (indice condiviso dal calendario dei pagamenti)."""
+        i = self._positions[str(loan_id)]
+        start = dt.datetime.fromisoformat(self.start_dates[i].isoformat())
+        return _payment_calendar(start, self.frequencies[i], int(self.offsets[i + 1] - self.offsets[i]))
+
+    def totals(self, column):
+        """Somma di una colonna per ciascun prestito, nell'ordine di loan_ids."""
+        values = self.columns[column]
+        lengths = np.diff(self.offsets)
+        result = np.zeros(len(self.loan_ids), dtype=np.float64)
+        non_empty = lengths > 0
+        if values.size:
+            result[non_empty] = np.add.reduceat(values, self.offsets[:-1][non_empty])
+        return result
+
+_CANDIDATE_DISTRIBUTIONS = ('norm', 'lognorm', 'gamma', 'beta', 'cauchy', 't')
+
+def _fit_candidate(dist_name, values):
+    """Stima MLE e statistica KS di una distribuzione candidata (eseguibile in un processo separato)."""
+    dist = getattr(stats, dist_name)
+    try:
+        params = dist.fit(values)
+        ks_stat, _ = stats.kstest(values, dist_name, args=params)
+        return dist_name, tuple(float(p) for p in params), float(ks_stat)
+    except Exception as e:
+        print(f"Errore nell'adattamento della distribuzione {dist_name}: {e}")
+        return dist_name, None, float('inf')
+
+class EuriborStore:
+    """
+    Archivio locale persistente delle serie storiche Euribor della BCE.
+
+    Ogni serie (un codice di Loan.SERIES_CODES) è salvata in un file colonnare .npz
+    (TIME_PERIOD, OBS_VALUE) nella cartella di cache. La serie viene caricata in memoria una
+    sola volta e integrata scaricando dalla BCE solo i mesi mancanti; se la rete non è
+    disponibile si continua a lavorare con i dati già in cache.
+    """
+    HISTORY_START = '1994-01-01'
+
+    def __init__(self, cache_dir=None, refresh_interval=12 * 3600):
+        self.cache_dir = cache_dir or os.path.join(os.path.expanduser('~'), '.loan_manager', 'euribor')
+        self.refresh_interval = refresh_interval  # secondi tra due tentativi di aggiornamento
+        self._series = {}
+        self._last_refresh = {}
+        self._fits = {}
+        self._lock = threading.Lock()
+        self._fit_lock = threading.Lock()
+
+    def _path(self, series_code):
+        return os.path.join(self.cache_dir, f"{series_code}.npz")
+
+    def _fit_path(self, series_code):
+        return os.path.join(self.cache_dir, f"{series_code}.fit.json")
+
+    @staticmethod
+    def _empty():
+        return pd.DataFrame({'TIME_PERIOD': pd.to_datetime([]), 'OBS_VALUE': np.array([], dtype=np.float64)})
+
+    def _read(self, series_code):
+        path = self._path(series_code)
+        if not os.path.exists(path):
+            return self._empty()
+        try:
+            with np.load(path) as data:
+                return pd.DataFrame({
+                    'TIME_PERIOD': pd.to_datetime(data['TIME_PERIOD']),
+                    'OBS_VALUE': data['OBS_VALUE']
+                })
+        except Exception as e:
+            print(f"WARN: Cache Euribor illeggibile ({path}): {e}")
+            return self._empty()
+
+    def _write(self, series_code, data):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(series_code)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path,
+                 TIME_PERIOD=data['TIME_PERIOD'].to_numpy(dtype='datetime64[ns]'),
+                 OBS_VALUE=data['OBS_VALUE'].to_numpy(dtype=np.float64))
+        os.replace(tmp_path, path)
+
+    def _needs_refresh(self, series_code, data):
+        last_attempt = self._last_refresh.get(series_code)
+        if last_attempt is not None and time.time() - last_attempt < self.refresh_interval:
+            return False
+        if data.empty:
+            return True
+        # Il dato del mese M viene pubblicato all'inizio del mese M+1
+        last_available = pd.Timestamp.now().to_period('M') - 1
+        return data['TIME_PERIOD'].iloc[-1].to_period('M') < last_available
+
+    def _refresh(self, series_code, frequency, data):
+        """Scarica dalla BCE solo le osservazioni successive all'ultima presente in cache."""
+        self._last_refresh[series_code] = time.time()
+        if data.empty:
+            start = pd.Timestamp(self.HISTORY_START)
+        else:
+            start = data['TIME_PERIOD'].iloc[-1] + pd.offsets.MonthBegin(1)
+        try:
+            new_data = ecbdata.get_series(
+                series_code,
+                start=Loan.format_date(start, frequency),
+                end=Loan.format_date(pd.Timestamp.now(), frequency)
+            )
+        except Exception as e:
+            print(f"WARN: Download Euribor non riuscito ({series_code}), uso i dati in cache: {e}")
+            return data
+        if new_data is None or new_data.empty:
+            return data
+
+        new_data = new_data[['TIME_PERIOD', 'OBS_VALUE']].copy()
+        new_data['OBS_VALUE'] = new_data['OBS_VALUE'] / 100  # conversione in formato decimale
+        new_data['TIME_PERIOD'] = pd.to_datetime(new_data['TIME_PERIOD'])
+
+        merged = (pd.concat([data, new_data], ignore_index=True)
+                  .drop_duplicates('TIME_PERIOD', keep='last')
+                  .sort_values('TIME_PERIOD')
+                  .reset_index(drop=True))
+        if len(merged) != len(data):
+            try:
+                self._write(series_code, merged)
+            except Exception as e:
+                print(f"WARN: Impossibile salvare la cache Euribor ({series_code}): {e}")
+        return merged
+
+    def get_series(self, frequency):
+        """Ritorna la serie completa in memoria (TIME_PERIOD, OBS_VALUE) per la frequenza indicata."""
+        series_code = Loan.SERIES_CODES.get(frequency)
+        if series_code is None:
+            raise ValueError("Frequenza non supportata. Scegli tra: monthly, quarterly, semi-annual, annual.")
+
+        with self._lock:
+            data = self._series.get(series_code)
+            if data is None:
+                data = self._read(series_code)
+            if self._needs_refresh(series_code, data):
+                data = self._refresh(series_code, frequency, data)
+            self._series[series_code] = data
+        return data
+
+    def _read_fit(self, series_code):
+        path = self._fit_path(series_code)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"WARN: Cache del fitting illeggibile ({path}): {e}")
+            return None
+
+    def _write_fit(self, series_code, fit):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._fit_path(series_code)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(fit, f)
+            os.replace(path + '.tmp', path)
+        except Exception as e:
+            print(f"WARN: Impossibile salvare la cache del fitting ({series_code}): {e}")
+
+    def get_best_fit(self, frequency, parallel=False):
+        """
+        Ritorna (best_dist, best_params) della serie, come Loan.fit_best_distribution.
+
+        Il risultato è memorizzato (in memoria e su disco accanto alla serie) con chiave
+        (codice serie, data dell'ultima osservazione) e ricalcolato solo quando la serie cambia.
+        """
+        data = self.get_series(frequency)
+        if data.empty:
+            raise ValueError(f"Nessun dato Euribor disponibile per la frequenza {frequency}")
+        series_code = Loan.SERIES_CODES[frequency]
+        last_observation = data['TIME_PERIOD'].iloc[-1].date().isoformat()
+
+        with self._fit_lock:
+            fit = self._fits.get(series_code)
+            if fit is None or fit['last_observation'] != last_observation:
+                fit = self._read_fit(series_code)
+            if fit is None or fit['last_observation'] != last_observation:
+                best_dist, best_params = Loan.fit_best_distribution(data['OBS_VALUE'], parallel=parallel)
+                if best_dist is None:
+                    raise ValueError(f"Nessuna distribuzione adattabile alla serie {series_code}")
+                fit = {
+                    'last_observation': last_observation,
+                    'distribution': best_dist.name,
+                    'params': list(best_params)
+                }
+                self._write_fit(series_code, fit)
+            self._fits[series_code] = fit
+
+        return getattr(stats, fit['distribution']), tuple(fit['params'])
+
+class PricingResultCache:
+    """
+    Archivio locale persistente dei risultati di Loan.calculate_probabilistic_pricing.
+
+    La chiave è lo sha256 dei parametri che determinano il risultato (condizioni del prestito,
+    parametri di default, griglie di tassi, durate e probabilità, modello e seed), escluso il
+    numero di iterazioni. Ogni voce è un file .npz con i tensori grezzi sum_irr/count_irr e le
+    iterazioni già eseguite: una richiesta con più iterazioni estende il risultato in cache
+    simulando solo quelle mancanti.
+    """
+    # Da incrementare quando cambia il modello di pricing, per invalidare i risultati salvati
+    MODEL_VERSION = 3
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or os.path.join(os.path.expanduser('~'), '.loan_manager', 'pricing')
+        self._lock = threading.Lock()
+
+    def key(self, **params):
+        """Chiave di contenuto per un insieme di parametri (valori serializzabili in JSON)."""
+        payload = json.dumps({'model_version': self.MODEL_VERSION, **params}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, key):
+        """Ritorna (sum_irr, count_irr, iterazioni) oppure None se il risultato non è in cache."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                return data['sum_irr'], data['count_irr'], int(data['iterations'])
+        except Exception as e:
+            print(f"WARN: Cache pricing illeggibile ({path}): {e}")
+            return None
+
+    def save(self, key, sum_irr, count_irr, iterations, params=None):
+        with self._lock:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                path = self._path(key)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+                np.savez(tmp_path,
+                         sum_irr=np.asarray(sum_irr, dtype=np.float64),
+                         count_irr=np.asarray(count_irr, dtype=np.int64),
+                         iterations=np.int64(iterations),
+                         params=json.dumps(params or {}, sort_keys=True))
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print(f"WARN: Impossibile salvare la cache pricing: {e}")
+
+    def clear(self):
+        """Elimina tutti i risultati salvati."""
+        with self._lock:
+            if os.path.isdir(self.cache_dir):
+                for name in os.listdir(self.cache_dir):
+                    if name.endswith('.npz'):
+                        os.remove(os.path.join(self.cache_dir, name))
+
+class LoanChanges:
+    """
+    Modifiche di un prestito non ancora salvate, raccolte da Loan.pending_changes()
+    e consumate da DbManager.save_loan / flush_dirty_loans.
+    - fields: colonne della tabella loans modificate -> nuovo valore
+    - schedule: il piano di ammortamento salvato non è più valido
+    - costs/expenses: voci nuove o con importo cambiato; removed_*: voci eliminate
+    Un prestito mai salvato (is_new) va scritto per intero.
+    """
+
+    def __init__(self, loan_id, is_new=False, fields=None, schedule=False,
+                 costs=None, removed_costs=(), expenses=None, removed_expenses=()):
+        self.loan_id = loan_id
+        self.is_new = is_new
+        self.fields = fields or {}
+        self.schedule = schedule
+        self.costs = costs or {}
+        self.removed_costs = list(removed_costs)
+        self.expenses = expenses or {}
+        self.removed_expenses = list(removed_expenses)
+
+    def __bool__(self):
+        return bool(
+            self.is_new or self.fields or self.schedule or self.costs
+            or self.removed_costs or self.expenses or self.removed_expenses
+        )
+
+    def __repr__(self):
+        return (f"LoanChanges({self.loan_id}, new={self.is_new}, fields={sorted(self.fields)}, "
+                f"schedule={self.schedule}, costs={len(self.costs) + len(self.removed_costs)}, "
+                f"expenses={len(self.expenses) + len(self.removed_expenses)})")
+
+
 class Loan:
     loans = []
 
-    def __init__(self, db_manager, rate, term, loan_amount, amortization_type, frequency, rate_type='fixed', use_euribor=False, update_frequency='monthly', downpayment_percent=0, additional_costs=None, periodic_expenses=None, start=dt.date.today().isoformat(), loan_id=None, should_save=True, euribor_spread=0.0):
+    # Attributi salvati nella tabella loans -> colonna corrispondente
+    _PERSISTED_COLUMNS = {
+        'initial_rate': 'initial_rate', 'initial_term': 'initial_term', 'loan_amount': 'loan_amount',
+        'amortization_type': 'amortization_type', 'frequency': 'frequency', 'rate_type': 'rate_type',
+        'use_euribor': 'use_euribor', 'update_frequency': 'update_frequency',
+        'downpayment_percent': 'downpayment_percent', 'start': 'start_date', 'active': 'active',
+    }
+    # Attributi persistiti che non incidono sul piano di ammortamento
+    _SCHEDULE_NEUTRAL = frozenset({'active'})
+
+    def __init__(self, db_manager, rate, term, loan_amount, amortization_type, frequency, rate_type='fixed', use_euribor=False, update_frequency='monthly', downpayment_percent=0, additional_costs=None, periodic_expenses=None, start=dt.date.today().isoformat(), loan_id=None, should_save=True, euribor_spread=0.0, loaded=False):
         self.loan_id = loan_id or str(uuid.uuid4())
         self.initial_rate = rate
         self.initial_term = term
@@ -721,7 +2388,7 @@ class Loan:
         self.additional_costs = additional_costs or {}
         self.periodic_expenses = periodic_expenses or {}
         self.taeg = {}
-        self.table = self.loan_table()
+        self._table = None  # Calcolata al primo accesso a self.table
         self.active = False
         self.db_manager = db_manager 
 
@@ -729,11 +2396,79 @@ class Loan:
         if self not in Loan.loans:
             Loan.loans.append(self)
             
-        # Save to database only if should_save is True
+        # Save to database only if should_save is True (save_to_db registra lo stato salvato).
+        # Un prestito costruito dalle righe del database (loaded=True) è già allineato;
+        # altrimenti resta "mai salvato" e il primo save_loan lo scrive per intero.
         if should_save:
             self.save_to_db()
+        elif loaded:
+            self.mark_clean()
 
 
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        # Traccia i campi persistiti modificati rispetto all'ultimo stato salvato/caricato
+        if name in Loan._PERSISTED_COLUMNS and '_saved_values' in self.__dict__:
+            if Loan._column_value(name, value) == self._saved_values[name]:
+                self._changed_fields.discard(name)
+            else:
+                self._changed_fields.add(name)
+
+    @staticmethod
+    def _column_value(name, value):
+        """Valore di un attributo persistito nella forma in cui è salvato nel database."""
+        if name in ('initial_rate', 'loan_amount', 'downpayment_percent'):
+            return float(value)
+        if name == 'initial_term':
+            return int(value)
+        if name in ('use_euribor', 'active'):
+            return bool(value)
+        if name == 'start':
+            return value.date()
+        return value
+
+    @staticmethod
+    def _amount_changes(saved, current):
+        """Voci (descrizione -> importo) nuove o modificate e voci rimosse rispetto a saved."""
+        current = current or {}
+        changed = {desc: float(amount) for desc, amount in current.items() if saved.get(desc) != float(amount)}
+        removed = [desc for desc in saved if desc not in current]
+        return changed, removed
+
+    def mark_clean(self):
+        """Registra lo stato attuale come allineato al database."""
+        self._saved_values = {
+            name: self._column_value(name, getattr(self, name)) for name in self._PERSISTED_COLUMNS
+        }
+        self._changed_fields = set()
+        self._saved_costs = {desc: float(amount) for desc, amount in (self.additional_costs or {}).items()}
+        self._saved_expenses = {desc: float(amount) for desc, amount in (self.periodic_expenses or {}).items()}
+
+    def is_persisted(self):
+        """True se il prestito è stato caricato dal database o salvato almeno una volta."""
+        return '_saved_values' in self.__dict__
+
+    def pending_changes(self):
+        """Modifiche rispetto all'ultimo caricamento o salvataggio, come LoanChanges."""
+        if not self.is_persisted():
+            return LoanChanges(self.loan_id, is_new=True, schedule=True)
+        costs, removed_costs = self._amount_changes(self._saved_costs, self.additional_costs)
+        expenses, removed_expenses = self._amount_changes(self._saved_expenses, self.periodic_expenses)
+        return LoanChanges(
+            self.loan_id,
+            fields={
+                self._PERSISTED_COLUMNS[name]: self._column_value(name, getattr(self, name))
+                for name in self._changed_fields
+            },
+            schedule=bool(self._changed_fields - self._SCHEDULE_NEUTRAL),
+            costs=costs, removed_costs=removed_costs,
+            expenses=expenses, removed_expenses=removed_expenses
+        )
+
+    def is_dirty(self):
+        """True se il prestito è cambiato dall'ultimo caricamento o salvataggio."""
+        return bool(self.pending_changes())
+
     def save_to_db(self):
         """Save loan to database"""
         if not self.db_manager:
@@ -747,6 +2482,7 @@ class Loan:
             self.downpayment_percent = float(self.downpayment_percent)
             
             self.db_manager.save_loan(self)
+            self.mark_clean()
                         # Ensure costs dictionaries exist
             if not hasattr(self, 'additional_costs') or self.additional_costs is None:
                 self.additional_costs = {}
@@ -761,18 +2497,7 @@ class Loan:
         """Elimina il prestito dal database e dalla memoria."""
         try:
             if self.db_manager:
-                # First delete related records
-                tables = [
-                    "amortization_schedule",
-                    "additional_costs",
-                    "periodic_expenses"
-                ]
-                
-                for table in tables:
-                    query = f"DELETE FROM {table} WHERE loan_id = %s"
-                    self.db_manager.execute_db_query(query, (self.loan_id,))
-
-                # Then delete the loan itself
+                # delete_loan rimuove anche i record collegati nella stessa transazione
                 if self.db_manager.delete_loan(self.loan_id):
                     if self in Loan.loans:
                         Loan.loans.remove(self)
@@ -798,7 +2523,9 @@ class Loan:
                 
         if self.db_manager:
             try:
-                self.db_manager.update_loan(self)
+                # Scrive solo le modifiche registrate dall'ultimo salvataggio
+                self.db_manager.save_loan(self)
+                self.mark_clean()
             except Exception as e:
                 print(f"Database update error: {str(e)}")
                 # You may want to show a message box here
@@ -807,6 +2534,21 @@ class Loan:
 
 
 
+    @property
+    def table(self):
+        """Piano di ammortamento, calcolato al primo accesso e ricalcolato dopo ogni invalidazione."""
+        if self._table is None:
+            self._table = self.loan_table()
+        return self._table
+
+    @table.setter
+    def table(self, value):
+        self._table = value
+
+    def invalidate_table(self):
+        """Segna il piano di ammortamento come non aggiornato."""
+        self._table = None
+
     def calculate_periods(self):
         if self.frequency == 'monthly':
             return self.initial_term * 12
@@ -849,6 +2591,11 @@ class Loan:
         'annual': 'FM.M.U2.EUR.RT.MM.EURIBOR1YD_.HSTA'
     }
 
+    # Archivio locale condiviso da tutti i prestiti e dai report
+    euribor_store = EuriborStore()
+    # Risultati del pricing probabilistico già calcolati
+    pricing_cache = PricingResultCache()
+
     @staticmethod
     def format_date(date: pd.Timestamp, frequency: str) -> str:
         """
@@ -874,13 +2621,10 @@ class Loan:
     @staticmethod
     def get_euribor_series(frequency: str, start: str, end: str) -> pd.DataFrame:
         """
-        Scarica la serie storica dell'Euribor in base alla frequenza.
+        Restituisce la serie storica dell'Euribor in base alla frequenza.
         
-        I formati di start e end vengono adattati:
-        - monthly: 'YYYY-MM'
-        - quarterly: 'YYYY-Qx'
-        - semi-annual: 'YYYY-Sx'
-        - annual: 'YYYY'
+        I dati sono serviti dall'archivio locale (Loan.euribor_store), che scarica dalla BCE
+        solo i mesi mancanti; start e end filtrano la serie a livello di mese.
         
         Parametri:
         frequency: una stringa tra 'monthly', 'quarterly', 'semi-annual', 'annual'
@@ -889,58 +2633,53 @@ class Loan:
         
         Ritorna un DataFrame con le colonne 'TIME_PERIOD' e 'OBS_VALUE' (i tassi in formato decimale).
         """
-        series_code = Loan.SERIES_CODES.get(frequency)
-        if series_code is None:
-            raise ValueError("Frequenza non supportata. Scegli tra: monthly, quarterly, semi-annual, annual.")
+        data = Loan.euribor_store.get_series(frequency)
         
-        # Converti le date in pd.Timestamp e formatta in base alla frequenza
-        start_ts = pd.to_datetime(start)
-        end_ts = pd.to_datetime(end)
-        start_str = Loan.format_date(start_ts, frequency)
-        end_str = Loan.format_date(end_ts, frequency)
-        
-        # Scarica i dati utilizzando ecbdata
-        data = ecbdata.get_series(series_code, start=start_str, end=end_str)
-        data = data[['TIME_PERIOD', 'OBS_VALUE']]
-        data['OBS_VALUE'] = data['OBS_VALUE'] / 100  # conversione in formato decimale
-        data['TIME_PERIOD'] = pd.to_datetime(data['TIME_PERIOD'])
-        return data
+        # Filtra sull'intervallo richiesto (mesi di start e end inclusi)
+        start_month = pd.to_datetime(start).to_period('M')
+        end_month = pd.to_datetime(end).to_period('M')
+        months = data['TIME_PERIOD'].dt.to_period('M')
+        mask = (months >= start_month) & (months <= end_month)
+        return data.loc[mask].reset_index(drop=True)
 
     @staticmethod
-    def fit_best_distribution(data: pd.Series):
+    def fit_best_distribution(data: pd.Series, parallel: bool = False):
         """
         Adatta diverse distribuzioni (Normale, Lognormale, Gamma, Beta, Cauchy, t) alla serie storica e ne sceglie la migliore
         in base al test KS.
         
         Parametri:
         data: Serie di tassi storici
+        parallel: se True, i sei fitting vengono eseguiti in parallelo su un pool di processi
         
         Ritorna:
         (best_dist, best_params): la distribuzione scelta e i relativi parametri stimati.
         """
-        distributions = [stats.norm, stats.lognorm, stats.gamma, stats.beta, stats.cauchy, stats.t]
+        values = np.asarray(data, dtype=np.float64)
+        
+        if parallel:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=len(_CANDIDATE_DISTRIBUTIONS)) as executor:
+                results = list(executor.map(_fit_candidate, _CANDIDATE_DISTRIBUTIONS,
+                                            [values] * len(_CANDIDATE_DISTRIBUTIONS)))
+        else:
+            results = [_fit_candidate(name, values) for name in _CANDIDATE_DISTRIBUTIONS]
+        
         best_dist = None
         best_params = None
         best_ks_stat = float('inf')
-        
-        for dist in distributions:
-            try:
-                params = dist.fit(data)
-                ks_stat, _ = stats.kstest(data, dist.name, args=params)
-                # Stampa di debug (opzionale)
-                print(f"{dist.name}: ks_stat={ks_stat}")
-                if ks_stat < best_ks_stat:
-                    best_ks_stat = ks_stat
-                    best_dist = dist
-                    best_params = params
-            except Exception as e:
-                print(f"Errore nell'adattamento della distribuzione {dist.name}: {e}")
-                continue
+        for dist_name, params, ks_stat in results:
+            # Stampa di debug (opzionale)
+            print(f"{dist_name}: ks_stat={ks_stat}")
+            if params is not None and ks_stat < best_ks_stat:
+                best_ks_stat = ks_stat
+                best_dist = getattr(stats, dist_name)
+                best_params = params
         return best_dist, best_params
 
     @staticmethod
     def generate_variable_rates_with_spread(initial_rate: float, periods: int, dist, params, 
-                                        historical_median: float, spread: float = 0.0, seed: int = None):
+                                        historical_median: float, spread: float = 0.0, seed: int = None,
+                                        n_paths: int = None):
         """
         Genera una sequenza di tassi variabili con l'aggiunta di uno spread.
         
@@ -952,98 +2691,66 @@ class Loan:
         historical_median: mediana dei tassi storici (da utilizzare in caso di tasso negativo)
         spread: spread da aggiungere al tasso Euribor (in decimale, es: 0.01 = 1%)
         seed: seme per la generazione casuale
+        n_paths: se indicato, genera n_paths percorsi indipendenti in un'unica estrazione
         
         Ritorna:
-        Una lista di tassi (float) di lunghezza 'periods' con spread applicato.
+        Una lista di tassi (float) di lunghezza 'periods' con spread applicato, oppure
+        un ndarray (n_paths x periods) se n_paths è indicato.
         """
         rng = np.random.default_rng(seed)
-        base_rates = [initial_rate]
-        for _ in range(periods - 1):
-            new_rate = dist.rvs(*params, size=1, random_state=rng)[0]
-            # Se il tasso generato è negativo, usa la mediana della serie storica
-            if new_rate < 0:
-                new_rate = historical_median
-            base_rates.append(new_rate)
+        draws_shape = (max(periods - 1, 0),) if n_paths is None else (n_paths, max(periods - 1, 0))
+        
+        # Estrazione vettoriale di tutti i tassi futuri
+        draws = np.asarray(dist.rvs(*params, size=draws_shape, random_state=rng), dtype=np.float64)
+        # Se un tasso generato è negativo, usa la mediana della serie storica
+        draws[draws < 0] = historical_median
         
-        # Applica lo spread a ogni tasso
-        return [rate + spread for rate in base_rates]
+        first = np.full(draws_shape[:-1] + (1,), initial_rate, dtype=np.float64)
+        rates = np.concatenate([first, draws], axis=-1) + spread
+        
+        if n_paths is None:
+            return rates.tolist()
+        return rates
 
 
+    def _euribor_model(self):
+        """
+        Ritorna (tasso Euribor corrente, mediana storica, distribuzione, parametri)
+        usati per simulare i tassi futuri dei prestiti variabili.
+        """
+        start_date = '1994-01-01'  # Data iniziale per un dataset storico significativo
+        end_date = dt.datetime.now().strftime('%Y-%m-%d')
+        euribor_data = self.get_euribor_series(self.frequency, start_date, end_date)
+        
+        # Verifica disponibilità dati Euribor
+        if euribor_data.empty:
+            raise ValueError(f"Nessun dato Euribor disponibile per la frequenza {self.frequency}")
+        
+        # Calcola il tasso corrente e parametri statistici
+        current_euribor_rate = euribor_data['OBS_VALUE'].iloc[-1]
+        historical_median = euribor_data['OBS_VALUE'].median()
+        best_dist, best_params = self.euribor_store.get_best_fit(self.frequency)
+        return current_euribor_rate, historical_median, best_dist, best_params
+
     def loan_table(self):
-        if self.frequency == 'monthly':
-            periods = [self.start + relativedelta(months=x) for x in range(self.periods)]
-        elif self.frequency == 'quarterly':
-            periods = [self.start + relativedelta(months=3 * x) for x in range(self.periods)]
-        elif self.frequency == 'semi-annual':
-            periods = [self.start + relativedelta(months=6 * x) for x in range (self.periods)]
-        elif self.frequency == 'annual':
-            periods = [self.start + relativedelta(years=x) for x in range(self.periods)]
-        else:
-            raise ValueError("Unsupported frequency")
+        periods = _payment_calendar(self.start, self.frequency, self.periods)
         
         if self.rate_type == 'fixed':
-            if self.amortization_type == "French":
-                interest = [npf.ipmt(self.rate, month, self.periods, -self.loan_amount)
-                            for month in range(1, self.periods + 1)]
-            
-                principal = [npf.ppmt(self.rate, month, self.periods, -self.loan_amount)
-                            for month in range(1, self.periods + 1)]
-                
-                balance = [self.loan_amount - sum(principal[:x]) for x in range(1, self.periods + 1)]
-
-                table = pd.DataFrame({
-                    'Initial Debt': [self.loan_amount] + balance[:-1],
-                    'Payment': [self.pmt] * self.periods,
-                    'Interest': interest,
-                    'Principal': principal,
-                    'Balance': balance
-                }, index=pd.to_datetime(periods))
-
-            elif self.amortization_type == "Italian":
-                principal_payment = self.loan_amount / self.periods
-                interest = [(self.loan_amount - principal_payment * x) * self.rate for x in range(self.periods)]
-                principal = [principal_payment] * self.periods
-                payment = [interest[x] + principal[x] for x in range(self.periods)]
-                balance = [self.loan_amount - sum(principal[:x+1]) for x in range(self.periods)]
-
-                table = pd.DataFrame({
-                    'Initial Debt': [self.loan_amount] + balance[:-1],
-                    'Payment': payment,
-                    'Interest': interest,
-                    'Principal': principal,
-                    'Balance': balance
-                }, index=pd.to_datetime(periods))
-
-            else:
-                raise ValueError("Unsupported amortization type")
+            initial_debt, payment, interest, principal, balance = _amortization_arrays(
+                self.loan_amount, self.rate, self.periods, np.arange(self.periods), self.amortization_type)
+
+            table = pd.DataFrame({
+                'Initial Debt': initial_debt,
+                'Payment': payment,
+                'Interest': interest,
+                'Principal': principal,
+                'Balance': balance
+            }, index=periods)
             return table.round(2)
         
 
         elif self.rate_type == 'variable' and self.use_euribor:
-                    start_date = '1994-01-01'  # Data iniziale per un dataset storico significativo
-                    end_date = dt.datetime.now().strftime('%Y-%m-%d')
-                    euribor_data = self.get_euribor_series(self.frequency, start_date, end_date)
-                    
-                    # Verifica disponibilità dati Euribor
-                    if euribor_data.empty:
-                        raise ValueError(f"Nessun dato Euribor disponibile per la frequenza {self.frequency}")
-                    
-                    # Calcola il tasso corrente e parametri statistici
-                    current_euribor_rate = euribor_data['OBS_VALUE'].iloc[-1]
-                    historical_median = euribor_data['OBS_VALUE'].median()
-                    best_dist, best_params = self.fit_best_distribution(euribor_data['OBS_VALUE'])
-                    
-                    # Genera le date dei periodi in base alla frequenza
-                    if self.frequency == 'monthly':
-                        periods_dates = [self.start + relativedelta(months=x) for x in range(self.periods)]
-                    elif self.frequency == 'quarterly':
-                        periods_dates = [self.start + relativedelta(months=3 * x) for x in range(self.periods)]
-                    elif self.frequency == 'semi-annual':
-                        periods_dates = [self.start + relativedelta(months=6 * x) for x in range(self.periods)]
-                    elif self.frequency == 'annual':
-                        periods_dates = [self.start + relativedelta(years=x) for x in range(self.periods)]
-                    else:
-                        raise ValueError("Unsupported frequency")
+                    current_euribor_rate, historical_median, best_dist, best_params = self._euribor_model()
                     
                     # Per la prima rata utilizziamo l'ultimo valore Euribor noto più lo spread
                     first_rate = current_euribor_rate + self.euribor_spread
@@ -1061,92 +2768,9 @@ class Loan:
                         # Se c'è un solo periodo, usiamo solo il tasso corrente
                         variable_rates = [first_rate]
                     
-                    # Calcola il piano di ammortamento in base al tipo
-                    if self.amortization_type == "French":
-                        # Metodo Francese (a rata costante per ogni tasso)
-                        initial_balance = [self.loan_amount]
-                        final_balance = []
-                        interest = []
-                        principal = []
-                        payment = []
-                        
-                        for i in range(self.periods):
-                            period_rate = variable_rates[i]
-                            remaining_periods = self.periods - i
-                            
-                            # Ricalcolo della rata in base al tasso corrente e al capitale residuo
-                            period_payment = abs(npf.pmt(period_rate, remaining_periods, -initial_balance[i]))
-                            
-                            # Calcolo delle componenti della rata
-                            period_interest = period_rate * initial_balance[i]
-                            period_principal = period_payment - period_interest
-                            period_final_balance = initial_balance[i] - period_principal
-                            
-                            # Gestione dell'ultimo periodo per assicurare che il saldo finale sia esattamente zero
-                            if i == self.periods - 1:
-                                # Aggiustiamo la quota capitale per far chiudere il piano a zero
-                                period_principal = initial_balance[i]
-                                period_payment = period_interest + period_principal
-                                period_final_balance = 0
-                            
-                            # Accumulo dei valori
-                            payment.append(period_payment)
-                            interest.append(period_interest)
-                            principal.append(period_principal)
-                            final_balance.append(period_final_balance)
-                            
-                            # Prepara il saldo iniziale per il periodo successivo
-                            if i < self.periods - 1:
-                                initial_balance.append(period_final_balance)
-                        
-                    elif self.amortization_type == "Italian":
-                        # Metodo Italiano (quota capitale costante)
-                        # La quota capitale è costante per definizione
-                        principal_payment = self.loan_amount / self.periods
-                        initial_balance = [self.loan_amount]
-                        final_balance = []
-                        principal = []
-                        interest = []
-                        payment = []
-                        
-                        for i in range(self.periods):
-                            # Calcolo interessi per questo periodo
-                            period_interest = initial_balance[i] * variable_rates[i]
-                            
-                            # Gestione dell'ultimo periodo per assicurare che il saldo finale sia esattamente zero
-                            if i == self.periods - 1:
-                                period_principal = initial_balance[i]
-                            else:
-                                period_principal = principal_payment
-                            
-                            # Calcolo rata e saldo finale
-                            period_payment = period_interest + period_principal
-                            period_final_balance = initial_balance[i] - period_principal
-                            
-                            # Accumulo dei valori
-                            interest.append(period_interest)
-                            principal.append(period_principal)
-                            payment.append(period_payment)
-                            final_balance.append(period_final_balance)
-                            
-                            # Prepara il saldo iniziale per il periodo successivo
-                            if i < self.periods - 1:
-                                initial_balance.append(period_final_balance)
-                    else:
-                        raise ValueError("Unsupported amortization type")
-                    
-                    # Verifica che tutte le liste abbiano la stessa lunghezza
-                    list_lengths = {
-                        'initial_balance': len(initial_balance),
-                        'payment': len(payment),
-                        'interest': len(interest),
-                        'principal': len(principal),
-                        'final_balance': len(final_balance),
-                        'periods_dates': len(periods_dates)
-                    }
-                    
-                    if len(set(list_lengths.values())) != 1:
-                        raise ValueError(f"Inconsistent list lengths in loan table calculation: {list_lengths}")
+                    # Calcola il piano di ammortamento (rata ricalcolata ad ogni periodo)
+                    initial_balance, payment, interest, principal, final_balance = _variable_rate_schedule_arrays(
+                        self.loan_amount, np.asarray(variable_rates, dtype=np.float64), self.amortization_type)
                     
                     # Creazione della tabella di ammortamento
                     table = pd.DataFrame({
@@ -1155,15 +2779,48 @@ class Loan:
                         'Interest': interest,
                         'Principal': principal,
                         'Balance': final_balance
-                    }, index=pd.to_datetime(periods_dates))
+                    }, index=periods)
                     
                     return table.round(2)
         else:
             raise ValueError("Unsupported rate type or Euribor configuration")
 
 
+    def simulate_rate_scenarios(self, n_paths: int = 1000, percentiles=(5, 50, 95), seed: int = None):
+        """
+        Simula n_paths percorsi di tasso Euribor e calcola il piano (rata ricalcolata) per tutti
+        i percorsi in un'unica computazione vettoriale.
+
+        Parametri:
+        n_paths: numero di scenari di tasso da simulare
+        percentiles: percentili da calcolare per ogni periodo
+        seed: seme per la generazione casuale
+
+        Ritorna:
+        Un dizionario {'Payment', 'Interest', 'Balance'} di DataFrame indicizzati per data di
+        pagamento, con una colonna per percentile (es. 'P5', 'P50', 'P95').
+        """
+        if not (self.rate_type == 'variable' and self.use_euribor):
+            raise ValueError("Rate scenarios are only available for variable-rate Euribor loans")
+
+        current_euribor_rate, historical_median, best_dist, best_params = self._euribor_model()
+        rates = self.generate_variable_rates_with_spread(
+            current_euribor_rate, self.periods, best_dist, best_params,
+            historical_median, self.euribor_spread, seed=seed, n_paths=n_paths)
+
+        _, payment, interest, _, balance = _variable_rate_schedule_arrays(
+            self.loan_amount, rates, self.amortization_type)
+
+        dates = _payment_calendar(self.start, self.frequency, self.periods)
+        columns = [f"P{p:g}" for p in percentiles]
+        bands = {}
+        for name, values in (('Payment', payment), ('Interest', interest), ('Balance', balance)):
+            band = np.percentile(values, percentiles, axis=0)
+            bands[name] = pd.DataFrame(band.T, index=dates, columns=columns).round(2)
+        return bands
+
     def plot_balances(self):
-        amort = self.loan_table()
+        amort = self.table
         if self.amortization_type == "French":
             plt.title("French Amortization Interest and Balance")
         elif self.amortization_type == "Italian":
@@ -1267,16 +2924,11 @@ class Loan:
         self.rate = self.calculate_rate()
         self.pmt = abs(npf.pmt(self.rate, self.periods, self.loan_amount))
         self.pmt_str = f"€ {self.pmt:,.2f}"
-        self.table = self.loan_table()
+        self.invalidate_table()
         self.update_db()
 
-    def calculate_taeg(self):
-
-        """
-        Calcola il TAEG periodico e annualizzato. Il TAEG è il tasso che uguaglia la somma attualizzata
-        dei pagamenti periodici (rate lorde) all'importo erogato (prestito netto dopo le spese iniziali).
-        """
-
+    def _taeg_inputs(self):
+        """Ritorna (importo netto erogato, rata lorda, periodi per anno) usati nel calcolo del TAEG."""
         # Importo del prestito iniziale al netto delle spese iniziali
         loan_amount = float(self.loan_amount)
         initial_expenses = float(sum(self.additional_costs.values()))
@@ -1288,29 +2940,13 @@ class Loan:
         # Pagamento periodico lordo (inclusi eventuali costi periodici)
         gross_payment = float(self.pmt) + total_periodic_expenses
 
-        # Durata del prestito in anni, tenendo conto della frequenza dei pagamenti
-        if self.frequency == 'monthly':
-            periods_in_years = np.array([(i + 1) / 12 for i in range(self.periods)])
-            periods_per_year = 12
-        elif self.frequency == 'quarterly':
-            periods_in_years = np.array([(i + 1) / 4 for i in range(self.periods)])
-            periods_per_year = 4
-        elif self.frequency == 'semi-annual':
-            periods_in_years = np.array([(i + 1) / 2 for i in range(self.periods)])
-            periods_per_year = 2
-        elif self.frequency == 'annual':
-            periods_in_years = np.array([(i + 1) for i in range(self.periods)])
-            periods_per_year = 1
-        else:
+        periods_per_year = _PERIODS_PER_YEAR.get(self.frequency)
+        if periods_per_year is None:
             raise ValueError("Unsupported frequency")
+        return net_loan_amount, gross_payment, periods_per_year
 
-        # Funzione da azzerare per calcolare il TAEG periodico
-        def taeg_func(r): 
-            return sum([gross_payment / (1 + r)**t for t in periods_in_years]) - net_loan_amount
-
-        # Trova la radice dell'equazione per ottenere il TAEG periodico
-        period_rate = brentq(taeg_func, 0, 1)
-
+    def _set_taeg(self, period_rate, periods_per_year):
+        """Aggiorna gli attributi TAEG a partire dal tasso periodico risolto."""
         # Calcola il TAEG annualizzato
         annualized_taeg = (1 + period_rate)**periods_per_year - 1
 
@@ -1330,6 +2966,43 @@ class Loan:
         
         return f'TAEG Periodico: {period_taeg_percent:.4f}%, TAEG Annualizzato: {annualized_taeg_percent:.4f}%'
 
+    def calculate_taeg(self):
+
+        """
+        Calcola il TAEG periodico e annualizzato. Il TAEG è il tasso che uguaglia la somma attualizzata
+        dei pagamenti periodici (rate lorde) all'importo erogato (prestito netto dopo le spese iniziali).
+        """
+        net_loan_amount, gross_payment, periods_per_year = self._taeg_inputs()
+
+        # Trova la radice dell'equazione per ottenere il TAEG periodico
+        period_rate = solve_taeg_batch([net_loan_amount], [gross_payment], [self.periods], [periods_per_year])[0]
+        if np.isnan(period_rate):
+            raise ValueError("Impossibile calcolare il TAEG: nessuna soluzione nell'intervallo [0, 1]")
+
+        return self._set_taeg(period_rate, periods_per_year)
+
+    @classmethod
+    def calculate_taeg_batch(cls, loans):
+        """
+        Calcola il TAEG di molti prestiti in un'unica risoluzione vettoriale.
+        I prestiti per cui non esiste soluzione restano con taeg vuoto.
+        """
+        if not loans:
+            return
+        inputs = [loan._taeg_inputs() for loan in loans]
+        rates = solve_taeg_batch(
+            [net for net, _, _ in inputs],
+            [gross for _, gross, _ in inputs],
+            [loan.periods for loan in loans],
+            [ppy for _, _, ppy in inputs]
+        )
+        for loan, rate, (_, _, periods_per_year) in zip(loans, rates, inputs):
+            if np.isnan(rate):
+                print(f"Impossibile calcolare il TAEG del prestito {loan.loan_id}")
+                loan.taeg = {}
+            else:
+                loan._set_taeg(float(rate), periods_per_year)
+
 
     @classmethod
     def compare_loans(cls, loans):
@@ -1338,6 +3011,9 @@ class Loan:
 
         results = []
         
+        # Calcola in blocco il TAEG dei prestiti che ancora non lo hanno
+        cls.calculate_taeg_batch([loan for loan in loans if not loan.taeg])
+        
         for i, loan in enumerate(loans):
             if not loan.taeg:
                 loan.calculate_taeg()
@@ -1490,6 +3166,8 @@ class Loan:
         weighted_payments_sum = 0
         weighted_taeg_sum = 0
 
+        cls.calculate_taeg_batch([loan for loan in selected_loans if not loan.taeg])
+
         for loan in selected_loans:
             # Ensure TAEG is calculated for each loan
             if not loan.taeg:
@@ -1538,6 +3216,122 @@ class Loan:
 
         return consolidated_loan
 
+    # Modalità di esecuzione delle simulazioni stocastiche di pricing
+    PRICING_EXECUTION_MODES = ('threads', 'prange', 'processes')
+
+    def _run_pricing_simulations(self, payment_buffer, payment_offsets, interest_rates_array,
+                                 loan_lives_array, default_probabilities_array, num_iterations,
+                                 default_decay, final_default, recovery_rate, recovery_concentration,
+                                 periods_per_year, seed, progress_callback,
+                                 execution_mode='threads', max_workers=None,
+                                 first_iteration=0, sum_irr=None, count_irr=None):
+        """
+        Esegue le iterazioni stocastiche [first_iteration, num_iterations) e restituisce
+        (somma degli IRR, numero di campioni) per combinazione, a partire dai totali sum_irr
+        e count_irr se indicati (estensione di un risultato in cache).
+
+        execution_mode:
+        - 'threads': kernel nogil su un ThreadPoolExecutor di max_workers thread;
+        - 'prange': gruppi di batch eseguiti con prange sul pool di thread di numba;
+        - 'processes': ProcessPoolExecutor (spawn) di max_workers processi, riutilizzato tra
+          le chiamate, che restituiscono il risultato di ciascun batch.
+        Ogni iterazione ha il proprio seed e gli IRR vengono sommati nell'ordine delle
+        iterazioni, quindi a parità di seed i risultati coincidono in tutte le modalità e
+        un'estensione da first_iteration è identica a un calcolo completo.
+        Restano in memoria solo i batch in corso (al più max_workers * 4), non un risultato
+        per batch: l'occupazione non cresce con num_iterations.
+        """
+        if execution_mode not in self.PRICING_EXECUTION_MODES:
+            raise ValueError(f"Unsupported execution mode: {execution_mode}")
+
+        # Calculate the total number of simulations
+        rate_count = len(interest_rates_array)
+        life_count = len(loan_lives_array)
+        prob_count = len(default_probabilities_array)
+        total_parameter_combinations = rate_count * prob_count * life_count
+        total_calculations = (num_iterations - first_iteration) * total_parameter_combinations
+        
+        # Configure parallel processing optimally
+        if max_workers is None:
+            if execution_mode == 'processes':
+                max_workers = os.cpu_count() or 1
+            else:
+                max_workers = min(16, max(1, os.cpu_count() - 1))
+        
+        # Optimize batch size - larger batches for better numba performance
+        # (i batch contengono iterazioni intere, ciascuna su tutte le combinazioni)
+        batch_size = min(10000, max(2000, total_calculations // (max_workers * 5)))
+        batch_iterations = max(1, batch_size // total_parameter_combinations)
+        batch_starts = np.arange(first_iteration, num_iterations, batch_iterations, dtype=np.int64)
+        batch_ends = np.minimum(batch_starts + batch_iterations, num_iterations)
+        total_batches = len(batch_starts)
+        # Batch in corso (e risultati in attesa di essere sommati) al più
+        window = max(1, max_workers * 4)
+        
+        kernel_args = (
+            float(self.loan_amount), interest_rates_array, loan_lives_array, default_probabilities_array,
+            payment_buffer, payment_offsets, default_decay, final_default,
+            recovery_rate, recovery_concentration, periods_per_year
+        )
+        kernel_seed = -1 if seed is None else seed
+        
+        shape = (rate_count, life_count, prob_count)
+        sum_irr = np.zeros(shape) if sum_irr is None else np.array(sum_irr, dtype=np.float64)
+        count_irr = np.zeros(shape, dtype=np.int64) if count_irr is None else np.array(count_irr, dtype=np.int64)
+        
+        def report_progress(current):
+            if progress_callback and (current % 5 == 0 or current == total_batches):
+                progress_callback(current, total_batches, (current / total_batches) * 100)
+        
+        def run_in_order(submit_batch):
+            # Al più `window` batch in corso; gli IRR vengono sommati nell'ordine dei batch,
+            # così la somma non dipende dall'ordine di completamento
+            pending = deque()
+            next_batch = 0
+            try:
+                for current in range(1, total_batches + 1):
+                    while next_batch < total_batches and len(pending) < window:
+                        pending.append(submit_batch(next_batch))
+                        next_batch += 1
+                    _accumulate_simulation_samples(sum_irr, count_irr, pending.popleft().result())
+                    report_progress(current)
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+        
+        if execution_mode == 'threads':
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                run_in_order(lambda batch_idx: executor.submit(
+                    _process_simulation_batch,
+                    *kernel_args, batch_starts[batch_idx], batch_ends[batch_idx], kernel_seed
+                ))
+        
+        elif execution_mode == 'prange':
+            previous_threads = nb.get_num_threads()
+            nb.set_num_threads(min(max_workers, nb.config.NUMBA_NUM_THREADS))
+            try:
+                # Gruppi di batch per chiamata, così l'avanzamento viene comunque notificato
+                group = max(1, nb.get_num_threads() * 4)
+                for first in range(0, total_batches, group):
+                    last = min(first + group, total_batches)
+                    _accumulate_simulation_samples(sum_irr, count_irr, _process_simulation_batches_prange(
+                        *kernel_args, batch_starts[first:last], batch_ends[first:last], kernel_seed
+                    ))
+                    if progress_callback:
+                        progress_callback(last, total_batches, (last / total_batches) * 100)
+            finally:
+                nb.set_num_threads(previous_threads)
+        
+        else:  # processes
+            executor = _get_pricing_process_pool(max_workers)
+            run_in_order(lambda batch_idx: executor.submit(
+                _run_pricing_batch_in_process, kernel_args,
+                int(batch_starts[batch_idx]), int(batch_ends[batch_idx]), kernel_seed
+            ))
+        
+        return sum_irr, count_irr
+
     def calculate_probabilistic_pricing(self, 
                                     initial_default: float = 0.2,
                                     default_decay: float = 0.9, 
@@ -1547,10 +3341,35 @@ class Loan:
                                     loan_lives: list = None,
                                     interest_rates: np.ndarray = None,
                                     default_probabilities: list = None,
-                                    progress_callback=None) -> pd.DataFrame:
+                                    progress_callback=None,
+                                    stochastic: bool = False,
+                                    recovery_concentration: float = 10.0,
+                                    seed: int = None,
+                                    execution_mode: str = 'threads',
+                                    max_workers: int = None,
+                                    use_cache: bool = False) -> pd.DataFrame:
         """
         Calculate probabilistic loan pricing using Monte Carlo simulation.
         Optimized for extremely large numbers of iterations (100k+) with near-compiled performance.
+
+        Con stochastic=False il modello è deterministico: ogni combinazione (tasso, durata,
+        probabilità di default) viene valutata una sola volta, qualunque sia num_iterations.
+        Con stochastic=True ogni iterazione estrae il periodo di default e il tasso di recupero
+        (Beta con media recovery_rate e concentrazione recovery_concentration); seed rende
+        il risultato riproducibile.
+
+        I due modelli riportano grandezze diverse e non vanno confrontati cella per cella:
+        il deterministico è l'IRR per passo del vettore di flussi attesi di
+        _calculate_adjusted_cashflow (un passo per valore della curva di default, non
+        annualizzato, poco sensibile alla probabilità di default); lo stocastico è la media
+        degli IRR annualizzati dei percorsi mensili simulati. La didascalia del risultato
+        indica quale dei due è riportato. execution_mode ('threads', 'prange', 'processes') e
+        max_workers scelgono come parallelizzare le simulazioni (vedi _run_pricing_simulations).
+
+        Con use_cache=True i risultati sono letti e salvati in Loan.pricing_cache: a parità di
+        parametri il calcolo non viene ripetuto e, nel modello stocastico, una richiesta con
+        più iterazioni di quelle in cache simula solo le iterazioni mancanti, con lo stesso
+        risultato di un calcolo completo. Nel modello stocastico senza seed la cache non è usata.
         """
         # Input validation and conversion to numpy arrays - same as before
         if loan_lives is None:
@@ -1569,94 +3388,102 @@ class Loan:
         frequency_map = {'monthly': 12, 'quarterly': 4, 'semi-annual': 2, 'annual': 1}
         periods_per_year = frequency_map[self.frequency]
         
-        # Pre-calculate all payment streams once
-        payment_streams = _generate_payment_streams(
-            self.loan_amount, 
-            interest_rates_array,
-            loan_lives_array,
-            self.amortization_type, 
-            periods_per_year
-        )
-        
-        # Convert payment streams to numba-compatible flat arrays
-        payment_keys, payment_values = _flatten_payment_streams(
-            interest_rates_array, 
-            loan_lives_array, 
-            payment_streams
-        )
-        
-        # Calculate the total number of simulations
-        rate_count = len(interest_rates_array)
-        life_count = len(loan_lives_array)
-        prob_count = len(default_probabilities_array)
-        total_parameter_combinations = rate_count * prob_count * life_count
-        total_calculations = num_iterations * total_parameter_combinations
-        
-        # Prepare final aggregation arrays
-        sum_irr = np.zeros((rate_count, life_count, prob_count))
-        count_irr = np.zeros((rate_count, life_count, prob_count), dtype=np.int32)
-        
-        # Configure parallel processing optimally
-        cpu_count = max(1, os.cpu_count() - 1) 
-        max_workers = min(16, cpu_count)
-        
-        # Optimize batch size - larger batches for better numba performance
-        batch_size = min(10000, max(2000, total_calculations // (max_workers * 5)))
-        
-        # Thread-safe progress tracking
-        progress_lock = threading.Lock()
-        progress_counter = [0]
-        
-        def run_batch(batch_idx, start_iter, end_iter):
-            local_sum, local_count = _process_simulation_batch(
-                float(self.loan_amount),
-                interest_rates_array, 
-                loan_lives_array, 
-                default_probabilities_array,
-                payment_keys,
-                payment_values,
-                num_iterations,
-                initial_default,
-                default_decay,
-                final_default,
-                recovery_rate,
-                periods_per_year,
-                start_iter,
-                end_iter
+        cache_key = None
+        cached = None
+        # Senza seed le simulazioni non sono riproducibili: niente da riusare né da salvare.
+        # execution_mode e max_workers non fanno parte della chiave: non cambiano il risultato.
+        # initial_default non è usato dal modello (la curva parte da default_probabilities).
+        if use_cache and not (stochastic and seed is None):
+            cache_params = {
+                'loan_amount': float(self.loan_amount),
+                'amortization_type': self.amortization_type,
+                'periods_per_year': periods_per_year,
+                'default_decay': float(default_decay),
+                'final_default': float(final_default),
+                'recovery_rate': float(recovery_rate),
+                'loan_lives': loan_lives_array.tolist(),
+                'interest_rates': interest_rates_array.tolist(),
+                'default_probabilities': default_probabilities_array.tolist(),
+                'stochastic': bool(stochastic),
+            }
+            if stochastic:
+                cache_params.update(recovery_concentration=float(recovery_concentration), seed=seed)
+            cache_key = self.pricing_cache.key(**cache_params)
+            cached = self.pricing_cache.load(cache_key)
+            expected_shape = (len(interest_rates_array), len(loan_lives_array), len(default_probabilities_array))
+            if cached is not None and cached[0].shape != expected_shape:
+                cached = None
+            elif cached is not None and stochastic and cached[2] > num_iterations:
+                # Le prime num_iterations non sono ricavabili dai totali in cache: si ricalcola
+                # senza sovrascrivere il risultato più ampio
+                cached = None
+                cache_key = None
+
+        if cached is None or (stochastic and num_iterations > cached[2]):
+            # Pre-calculate all payment streams once, in a flat buffer indexed by (rate_idx, life_idx)
+            payment_buffer, payment_offsets = _build_payment_buffer(
+                float(self.loan_amount), 
+                interest_rates_array,
+                loan_lives_array,
+                0 if self.amortization_type == "French" else 1, 
+                periods_per_year
             )
-            
-            # Update progress with minimal locking
-            with progress_lock:
-                progress_counter[0] += 1
-                current = progress_counter[0]
-                total_batches = (total_calculations + batch_size - 1) // batch_size
-                
-                if progress_callback and (current % 5 == 0 or current == total_batches):
-                    percent = (current / total_batches) * 100
-                    progress_callback(current, total_batches, percent)
-                    
-            return local_sum, local_count
-        
-        # Execute calculations in parallel
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = []
-            for i in range(0, total_calculations, batch_size):
-                futures.append(executor.submit(
-                    run_batch,
-                    i // batch_size,
-                    i,
-                    min(i + batch_size, total_calculations)
-                ))
-            
-            # Combine results as they complete
-            for future in concurrent.futures.as_completed(futures):
-                batch_sum, batch_count = future.result()
-                sum_irr += batch_sum
-                count_irr += batch_count
-        
-        # Calculate means - using numpy's vectorized operations
-        with np.errstate(divide='ignore', invalid='ignore'):
-            mean_irr = np.divide(sum_irr, count_irr, out=np.zeros_like(sum_irr), where=count_irr!=0)
+
+        if not stochastic:
+            if cached is not None:
+                sum_irr, count_irr, _ = cached
+            else:
+                # Nessuna estrazione casuale: tutte le iterazioni di una combinazione darebbero
+                # lo stesso IRR, basta una valutazione per combinazione
+                irr_grid = _evaluate_pricing_grid(
+                    float(self.loan_amount),
+                    interest_rates_array,
+                    loan_lives_array,
+                    default_probabilities_array,
+                    payment_buffer,
+                    payment_offsets,
+                    default_decay,
+                    final_default,
+                    recovery_rate,
+                    periods_per_year
+                )
+                valid = ~np.isnan(irr_grid)
+                sum_irr = np.where(valid, irr_grid, 0.0)
+                count_irr = valid.astype(np.int64)
+                if cache_key:
+                    self.pricing_cache.save(cache_key, sum_irr, count_irr, 1, cache_params)
+            # Una valutazione vale per tutte le iterazioni richieste
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean_irr = np.divide(sum_irr, count_irr, out=np.zeros_like(sum_irr), where=count_irr!=0)
+            count_irr = np.where(count_irr > 0, num_iterations, 0)
+            if progress_callback:
+                progress_callback(1, 1, 100.0)
+        else:
+            if cached is not None:
+                sum_irr, count_irr, done_iterations = cached
+            else:
+                sum_irr = count_irr = None
+                done_iterations = 0
+
+            if num_iterations > done_iterations:
+                # Le iterazioni in cache sono le prime done_iterations: si prosegue dalla successiva,
+                # con i seed e l'ordine di somma che avrebbe avuto un calcolo completo
+                sum_irr, count_irr = self._run_pricing_simulations(
+                    payment_buffer, payment_offsets, interest_rates_array, loan_lives_array,
+                    default_probabilities_array, num_iterations, default_decay, final_default,
+                    recovery_rate, recovery_concentration, periods_per_year, seed, progress_callback,
+                    execution_mode=execution_mode, max_workers=max_workers,
+                    first_iteration=done_iterations, sum_irr=sum_irr, count_irr=count_irr
+                )
+                done_iterations = num_iterations
+                if cache_key:
+                    self.pricing_cache.save(cache_key, sum_irr, count_irr, done_iterations, cache_params)
+            elif progress_callback:
+                progress_callback(1, 1, 100.0)
+
+            # Calculate means - using numpy's vectorized operations
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean_irr = np.divide(sum_irr, count_irr, out=np.zeros_like(sum_irr), where=count_irr!=0)
         
         # Rest of the function for DataFrame creation remains the same
         results = []
@@ -1689,6 +3516,11 @@ class Loan:
         
         styled = pivot.style.background_gradient(cmap=sns.color_palette("RdYlGn", as_cmap=True))
         styled = styled.format("{:.2%}")
+        if stochastic:
+            styled = styled.set_caption("Stochastic model: mean annualized IRR of the simulated payment paths")
+        else:
+            styled = styled.set_caption("Deterministic model: per-step IRR of the expected cash flows "
+                                        "(one step per default-curve value, not annualized)")
         
         return styled
     
@@ -1877,26 +3709,22 @@ class Loan:
 
     @classmethod 
     def load_all_loans(cls, db_manager):
-        """Carica tutti i prestiti dal database nella lista loans usando threadpooling"""
+        """Carica tutti i prestiti dal database nella lista loans con costi e spese in blocco"""
         cls.clear_loans()  # Pulisce la lista esistente
         
         try:
-            # Carica i dati dal database
-            loans_data = db_manager.load_all_loans_from_db()
+            # Carica prestiti, costi e spese con un numero fisso di query
+            loans_data, costs_by_loan, expenses_by_loan = db_manager.load_all_loans_with_costs()
             
-            # Utilizzo di thread per caricare i prestiti in parallelo
-            with ThreadPoolExecutor(max_workers=min(10, len(loans_data))) as executor:
-                future_to_loan = {executor.submit(cls._load_single_loan, db_manager, loan_data): loan_data[0] 
-                                for loan_data in loans_data}
-                
-                for future in concurrent.futures.as_completed(future_to_loan):
-                    loan_id = future_to_loan[future]
-                    try:
-                        loan = future.result()
-                        if loan:
-                            cls.loans.append(loan)
-                    except Exception as e:
-                        print(f"Error loading loan {loan_id}: {str(e)}")
+            for loan_data in loans_data:
+                loan_id = str(loan_data[0])
+                loan = cls.load_single_loan(
+                    db_manager, loan_data,
+                    additional_costs=costs_by_loan.get(loan_id, {}),
+                    periodic_expenses=expenses_by_loan.get(loan_id, {})
+                )
+                if loan and loan not in cls.loans:
+                    cls.loans.append(loan)
             
             return True
             
@@ -1905,9 +3733,18 @@ class Loan:
             return False
 
     @classmethod
-    def load_single_loan(cls, db_manager, loan_data):
-        """Carica un singolo prestito dal database - utilizzato per threading"""
+    def load_single_loan(cls, db_manager, loan_data, additional_costs=None, periodic_expenses=None):
+        """
+        Carica un singolo prestito dal database.
+        Se costi e spese non sono forniti (caricamento in blocco), vengono letti dal database.
+        """
         try:
+            loan_id = str(loan_data[0])
+            if additional_costs is None:
+                additional_costs = db_manager.load_additional_costs(loan_id)
+            if periodic_expenses is None:
+                periodic_expenses = db_manager.load_periodic_expenses(loan_id)
+            
             loan = cls(
                 db_manager=db_manager,
                 rate=float(loan_data[1]),
@@ -1920,16 +3757,15 @@ class Loan:
                 update_frequency=loan_data[8],
                 downpayment_percent=float(loan_data[9]),
                 start=loan_data[10].isoformat(),
-                loan_id=str(loan_data[0]),
-                should_save=False 
+                loan_id=loan_id,
+                additional_costs=additional_costs,
+                periodic_expenses=periodic_expenses,
+                should_save=False,
+                loaded=True
             )
             
-            # Carica i costi aggiuntivi e le spese periodiche
-            loan.additional_costs = db_manager.load_additional_costs(loan.loan_id)
-            loan.periodic_expenses = db_manager.load_periodic_expenses(loan.loan_id)
-            
-            # Ricalcola tabella e TAEG con i nuovi costi
-            loan.table = loan.loan_table()
+            # Ricalcola il TAEG con i nuovi costi (la tabella non dipende dai costi
+            # e viene calcolata solo al primo accesso)
             loan.calculate_taeg()
             
             return loan
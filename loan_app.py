@@ -28,7 +28,7 @@ import time
 import numpy as np
 import pandas as pd
 import psycopg2
-from loan import Loan, DbManager
+from loan import Loan, DbManager, AsyncDbManager
 from ai_chatbot_loan import Chatbot
 from loan_crm import LoanCRM
 from loan_report import LoanReport
@@ -914,6 +914,37 @@ class AdditionalCostsDialog(FluentDialog):
             'periodic_expenses': periodic_costs
         }
 
+class DbTaskRunner(QObject):
+    """
+    Esegue chiamate al database in background tramite AsyncDbManager e consegna
+    risultato o errore ai callback nel thread della UI (via segnale Qt accodato).
+    """
+    _completed = pyqtSignal(object, object, object)  # future, on_success, on_error
+
+    def __init__(self, async_db, parent=None):
+        super().__init__(parent)
+        self.async_db = async_db
+        self._completed.connect(self._dispatch)
+
+    def run(self, func, *args, on_success=None, on_error=None, **kwargs):
+        """Avvia func(*args, **kwargs) in background e restituisce il Future."""
+        future = self.async_db.submit(func, *args, **kwargs)
+        future.add_done_callback(lambda done: self._completed.emit(done, on_success, on_error))
+        return future
+
+    @pyqtSlot(object, object, object)
+    def _dispatch(self, future, on_success, on_error):
+        try:
+            result = future.result()
+        except Exception as e:
+            if on_error:
+                on_error(e)
+            else:
+                print(f"ERROR: Background database task failed: {str(e)}")
+            return
+        if on_success:
+            on_success(result)
+
 class MonteCarloWorker(QObject):
     """Worker thread for Monte Carlo simulation"""
     progress = pyqtSignal(int)
@@ -2125,10 +2156,13 @@ class SidebarWidget(QWidget):
 
 class CRMWidget(QWidget):
     """Widget principale per la gestione del CRM."""
-    def __init__(self, crm_manager, parent=None, theme_manager=None):
+    def __init__(self, crm_manager, parent=None, theme_manager=None, db_tasks=None):
         super().__init__(parent)
         self.crm_manager = crm_manager
         self.theme_manager = theme_manager
+        # Le liste vengono caricate in background per non bloccare la UI
+        self.db_tasks = db_tasks or DbTaskRunner(AsyncDbManager(crm_manager.db_manager), self)
+        self._list_requests = {'clients': 0, 'corporations': 0}
         self.current_client = None
         self.current_corporation = None
         self.init_ui()
@@ -2388,26 +2422,35 @@ class CRMWidget(QWidget):
     
     # Individual client methods
     def load_clients(self):
-        """Carica la lista dei clienti dal CRM."""
-        try:
-            clients = self.crm_manager.list_clients()
-            self.clients_list.clear()
-            
-            if not clients:
-                self.clients_list.addItem("No clients found")
-                return
-                
-            for client in clients:
-                item_text = f"{client['first_name']} {client['last_name']}"
-                item = QListWidgetItem(item_text)
-                item.setData(Qt.UserRole, client['client_id'])
-                self.clients_list.addItem(item)
-                
-            self.current_client = None
-            self.toggle_client_buttons(False)
+        """Carica la lista dei clienti dal CRM in background."""
+        self._list_requests['clients'] += 1
+        request_id = self._list_requests['clients']
+        self.db_tasks.run(
+            lambda: [
+                (f"{client['first_name']} {client['last_name']}", client['client_id'])
+                for client in self.crm_manager.iter_clients()
+            ],
+            on_success=lambda items: self._show_list_items(
+                'clients', request_id, self.clients_list, items, "No clients found"),
+            on_error=lambda e: QMessageBox.critical(self, "Error", f"Failed to load clients: {str(e)}")
+        )
+        self.current_client = None
+        self.toggle_client_buttons(False)
+    
+    def _show_list_items(self, kind, request_id, list_widget, items, empty_text):
+        """Popola una lista con (testo, id) ignorando le risposte superate da una richiesta più recente."""
+        if request_id != self._list_requests[kind]:
+            return
+        list_widget.clear()
+        
+        if not items:
+            list_widget.addItem(empty_text)
+            return
             
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load clients: {str(e)}")
+        for item_text, item_id in items:
+            item = QListWidgetItem(item_text)
+            item.setData(Qt.UserRole, item_id)
+            list_widget.addItem(item)
     
     def on_client_selected(self, item):
         """Gestisce la selezione di un client dalla lista."""
@@ -2503,26 +2546,20 @@ class CRMWidget(QWidget):
     
     # Corporate client methods
     def load_corporations(self):
-        """Carica la lista delle aziende dal CRM."""
-        try:
-            corporations = self.crm_manager.list_corporations()
-            self.corporations_list.clear()
-            
-            if not corporations:
-                self.corporations_list.addItem("No corporations found")
-                return
-                
-            for corporation in corporations:
-                item_text = corporation['company_name']
-                item = QListWidgetItem(item_text)
-                item.setData(Qt.UserRole, corporation['corporation_id'])
-                self.corporations_list.addItem(item)
-                
-            self.current_corporation = None
-            self.toggle_corporation_buttons(False)
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load corporations: {str(e)}")
+        """Carica la lista delle aziende dal CRM in background."""
+        self._list_requests['corporations'] += 1
+        request_id = self._list_requests['corporations']
+        self.db_tasks.run(
+            lambda: [
+                (corporation['company_name'], corporation['corporation_id'])
+                for corporation in self.crm_manager.iter_corporations()
+            ],
+            on_success=lambda items: self._show_list_items(
+                'corporations', request_id, self.corporations_list, items, "No corporations found"),
+            on_error=lambda e: QMessageBox.critical(self, "Error", f"Failed to load corporations: {str(e)}")
+        )
+        self.current_corporation = None
+        self.toggle_corporation_buttons(False)
     
     def on_corporation_selected(self, item):
         """Gestisce la selezione di un'azienda dalla lista."""
@@ -3623,10 +3660,11 @@ class AssignLoanDialog(FluentDialog):
 class DashboardDialog(FluentDialog):
     """Interactive dashboard dialog with real-time data visualization."""
     
-    def __init__(self, db_manager, parent=None):
+    def __init__(self, db_manager, parent=None, db_tasks=None):
         super().__init__("Loan Dashboard", parent)
         self.db_manager = db_manager
-        self.dashboard_backend = DashboardBackend(db_manager)
+        self.db_tasks = db_tasks or DbTaskRunner(AsyncDbManager(db_manager), self)
+        self.dashboard_backend = DashboardBackend(db_manager, async_db=self.db_tasks.async_db)
         self.setMinimumWidth(1000)
         self.setMinimumHeight(700)
         self.setup_ui()
@@ -3942,7 +3980,7 @@ class DashboardDialog(FluentDialog):
         
         # Start auto-refresh if enabled
         if self.auto_refresh_cb.isChecked():
-            self.dashboard_backend.register_update_callback(self.update_dashboard)
+            self.dashboard_backend.register_update_callback(self._post_dashboard_update)
             self.dashboard_backend.start_auto_refresh(interval=30)  # 30 second refresh
         
     def refresh_data(self, priority_only=False):
@@ -3951,29 +3989,24 @@ class DashboardDialog(FluentDialog):
         self.refresh_btn.setEnabled(False)
         self.refresh_btn.setText("Loading...")
         
-        # Use a separate thread to fetch data
-        import threading
-        threading.Thread(target=self._fetch_data, 
-                         args=(priority_only,), 
-                         daemon=True).start()
+        # Fetch data in background; the result is delivered on the UI thread
+        self.db_tasks.run(
+            self.dashboard_backend.refresh_dashboard,
+            force=True, priority_only=priority_only,
+            on_success=self.update_dashboard,
+            on_error=self._on_refresh_error
+        )
     
-    def _fetch_data(self, priority_only):
-        """Fetch data in a separate thread."""
-        try:
-            data = self.dashboard_backend.refresh_dashboard(force=True, priority_only=priority_only)
-            # Use Qt's signal-slot to safely update UI from another thread
-            from PyQt5.QtCore import QMetaObject, Qt, Q_ARG
-            QMetaObject.invokeMethod(self, "update_dashboard", 
-                                     Qt.QueuedConnection,
-                                     Q_ARG(str, data))
-        except Exception as e:
-            print(f"Error fetching dashboard data: {e}")
-            # Update UI to show error
-            from PyQt5.QtCore import QMetaObject, Qt, Q_ARG
-            error_data = json.dumps({"error": str(e), "is_error": True})
-            QMetaObject.invokeMethod(self, "update_dashboard", 
-                                     Qt.QueuedConnection,
-                                     Q_ARG(str, error_data))
+    def _on_refresh_error(self, error):
+        print(f"Error fetching dashboard data: {error}")
+        self.update_dashboard(json.dumps({"error": str(error), "is_error": True}))
+
+    def _post_dashboard_update(self, json_data):
+        """Backend callback: it may run on a worker thread, so the UI update is queued."""
+        from PyQt5.QtCore import QMetaObject, Q_ARG
+        QMetaObject.invokeMethod(self, "update_dashboard", 
+                                 Qt.QueuedConnection,
+                                 Q_ARG(str, json_data))
 
     def toggle_map_detail_visibility(self, visible):
         """Show or hide the map detail level selector."""
@@ -4345,20 +4378,20 @@ class DashboardDialog(FluentDialog):
         """Toggle automatic data refresh."""
         if enabled:
             # Registra il callback
-            self.dashboard_backend.register_update_callback(self.update_dashboard)
+            self.dashboard_backend.register_update_callback(self._post_dashboard_update)
             
             # Avvia il refresh con l'intervallo specificato direttamente
             # (funzione modificata per operare nel thread principale)
             self.dashboard_backend.start_auto_refresh(interval=30)  # 30 secondi
         else:
             self.dashboard_backend.stop_auto_refresh()
-            self.dashboard_backend.unregister_update_callback(self.update_dashboard)
+            self.dashboard_backend.unregister_update_callback(self._post_dashboard_update)
             
     def closeEvent(self, event):
         """Handle dialog close event."""
         # Stop auto-refresh when closing
         self.dashboard_backend.stop_auto_refresh()
-        self.dashboard_backend.unregister_update_callback(self.update_dashboard)
+        self.dashboard_backend.unregister_update_callback(self._post_dashboard_update)
         super().closeEvent(event)
 
 
@@ -6109,6 +6142,9 @@ class LoanApp(QMainWindow):
         self.db_manager.create_db()
 
         self.crm_manager = LoanCRM(self.db_manager)
+        # Le query partono in background e i risultati tornano nel thread della UI
+        self.async_db = AsyncDbManager(self.db_manager)
+        self.db_tasks = DbTaskRunner(self.async_db, self)
         # Create the TaskManager widget
         self.task_manager_widget = TaskManagerWidget(parent=self, theme_manager=self.theme_manager)
 
@@ -6134,7 +6170,7 @@ class LoanApp(QMainWindow):
         self.sidebar = SidebarWidget(parent=self, theme_manager=self.theme_manager)
         
         # Crea il widget CRM
-        self.crm_widget = CRMWidget(self.crm_manager, parent=self, theme_manager=self.theme_manager)
+        self.crm_widget = CRMWidget(self.crm_manager, parent=self, theme_manager=self.theme_manager, db_tasks=self.db_tasks)
         
         # Aggiungi un bottone per aprire il CRM nella sidebar
         crm_button = QPushButton("Customers")
@@ -6343,23 +6379,33 @@ class LoanApp(QMainWindow):
 
 
     def load_existing_loans(self):
-        """Carica i prestiti dal database e li mostra nella UI."""
+        """Carica i prestiti dal database in background e li mostra nella UI."""
         self.loans = []  # Puliamo la lista dei prestiti
         self.loan_listbox.clear()
+        self.loan_listbox.addItem("Loading loans...")
+        self.db_tasks.run(
+            self._fetch_existing_loans,
+            on_success=self._show_existing_loans,
+            on_error=self._on_existing_loans_error
+        )
 
-        loans_from_db = self.db_manager.load_all_loans_from_db()  # Recuperiamo i dati
+    def _on_existing_loans_error(self, error):
+        self.loan_listbox.clear()
+        print(f"Error loading loans: {str(error)}")
+        QMessageBox.critical(self, "Database Error", f"Impossibile caricare i prestiti: {str(error)}")
 
-        if not loans_from_db:
-            print("DEBUG: Nessun prestito trovato nel database.")  
-            QMessageBox.information(self, "Info", "Nessun prestito trovato nel database.")
-            return
+    def _fetch_existing_loans(self):
+        """Eseguito in background: legge prestiti, costi e spese e costruisce gli oggetti Loan."""
+        # Recuperiamo prestiti, costi e spese con un numero fisso di query
+        loans_from_db, costs_by_loan, expenses_by_loan = self.db_manager.load_all_loans_with_costs()
 
+        loans = []
         for loan_data in loans_from_db:
             try:
                 loan_id = str(loan_data[0])
-                # Carica prima i costi aggiuntivi e le spese periodiche
-                additional_costs = self.db_manager.load_additional_costs(loan_id)
-                periodic_expenses = self.db_manager.load_periodic_expenses(loan_id)
+                # Costi aggiuntivi e spese periodiche già raggruppati per prestito
+                additional_costs = costs_by_loan.get(loan_id, {})
+                periodic_expenses = expenses_by_loan.get(loan_id, {})
                 
                 # Crea nuovo prestito con tutti i dati
                 loan = Loan(
@@ -6377,26 +6423,42 @@ class LoanApp(QMainWindow):
                     loan_id=loan_id,
                     additional_costs=additional_costs,  # Aggiungi i costi qui
                     periodic_expenses=periodic_expenses,  # Aggiungi le spese qui
-                    should_save=False  # Importante: evita il doppio salvataggio
+                    should_save=False,  # Importante: evita il doppio salvataggio
+                    loaded=True
                 )
-                
-                self.loans.append(loan)
-
-                # Mostra il prestito nella UI
-                loan_text = f"Loan {loan_id} - €{loan_data[3]:,.2f} ({loan_data[4]})"
-                self.loan_listbox.addItem(loan_text)
+                loans.append((loan, loan_data))
 
             except Exception as e:
                 print(f"Error loading loan {loan_data[0]}: {str(e)}")
                 continue
 
+        return loans
+
+    def _show_existing_loans(self, loans):
+        """Eseguito nel thread della UI al termine del caricamento."""
+        self.loans = []
+        self.loan_listbox.clear()
+
+        if not loans:
+            print("DEBUG: Nessun prestito trovato nel database.")  
+            QMessageBox.information(self, "Info", "Nessun prestito trovato nel database.")
+            return
+
+        for loan, loan_data in loans:
+            self.loans.append(loan)
+
+            # Mostra il prestito nella UI
+            loan_text = f"Loan {loan.loan_id} - €{loan_data[3]:,.2f} ({loan_data[4]})"
+            self.loan_listbox.addItem(loan_text)
+
         print(f"DEBUG: Prestiti caricati nella lista ({len(self.loans)})")      
 
     def on_close(self, event):
         """Save all loans before closing"""
         try:
-            for loan in self.loans:
-                loan.update_db()
+            # Solo i prestiti modificati, in un'unica transazione
+            self.db_manager.flush_dirty_loans(self.loans)
+            self.async_db.shutdown(wait=False)
             event.accept()
         except Exception as e:
             reply = QMessageBox.question(
@@ -6659,7 +6721,7 @@ class LoanApp(QMainWindow):
 
     def open_dashboard(self):
         """Open the loan dashboard dialog."""
-        dashboard = DashboardDialog(self.db_manager, self)
+        dashboard = DashboardDialog(self.db_manager, self, db_tasks=self.db_tasks)
         dashboard.exec_()
 
     def open_ai_assistant(self):
@@ -6952,7 +7014,8 @@ class PricingWorker(QThread):
     calculation_error = pyqtSignal(str)  # error message
     
     def __init__(self, loan, initial_default, default_decay, final_default, 
-                 recovery_rate, iterations, loan_lives, interest_rates, default_probs):
+                 recovery_rate, iterations, loan_lives, interest_rates, default_probs, stochastic=False,
+                 seed=None):
         super().__init__()
         self.loan = loan
         self.initial_default = initial_default
@@ -6963,6 +7026,8 @@ class PricingWorker(QThread):
         self.loan_lives = loan_lives
         self.interest_rates = interest_rates
         self.default_probs = default_probs
+        self.stochastic = stochastic
+        self.seed = seed
         self.is_cancelled = False
         
     def run(self):
@@ -6983,7 +7048,11 @@ class PricingWorker(QThread):
                 loan_lives=self.loan_lives,
                 interest_rates=self.interest_rates,
                 default_probabilities=self.default_probs,
-                progress_callback=progress_callback
+                progress_callback=progress_callback,
+                stochastic=self.stochastic,
+                seed=self.seed,
+                # Input ripetuti sono letti dalla cache; più iterazioni estendono il risultato salvato
+                use_cache=True
             )
             
             # Emit the results
@@ -7032,10 +7101,21 @@ class ProbabilisticPricingDialog(FluentDialog):
         self.final_default = self.create_double_spinbox(0.4)
         self.recovery_rate = self.create_double_spinbox(0.4)
         self.iterations = self.create_spinbox(100, 10, 100000)
+        self.stochastic = QCheckBox("Simulate default timing and recovery")
+        self.seed = self.create_spinbox(42, 1, 999999)
+        self.seed.setSingleStep(1)
+        self.seed.setEnabled(False)
+        self.stochastic.toggled.connect(self.seed.setEnabled)
         
         # Add tooltips
         self.initial_default.setToolTip("Initial probability of default (0-1)")
         self.default_decay.setToolTip("Rate at which default probability decays")
+        self.stochastic.setToolTip("Sample default period and recovery rate in every iteration.\n"
+                                   "When unchecked the model is deterministic and iterations have no effect.\n"
+                                   "The stochastic model reports annualized IRRs, the deterministic model a\n"
+                                   "per-step IRR of the expected cash flows: the two are not comparable.")
+        self.seed.setToolTip("Seed of the stochastic simulation: the same inputs and seed give the same\n"
+                             "result, which is reused (and extended with more iterations) from the cache.")
         
         # Lists section
         lists_label = QLabel("Simulation Parameters")
@@ -7052,6 +7132,8 @@ class ProbabilisticPricingDialog(FluentDialog):
         form.addRow(self.create_label("Final Default:"), self.final_default)
         form.addRow(self.create_label("Recovery Rate:"), self.recovery_rate)
         form.addRow(self.create_label("Iterations:"), self.iterations)
+        form.addRow(self.create_label("Stochastic Model:"), self.stochastic)
+        form.addRow(self.create_label("Seed:"), self.seed)
         
         form.addRow(lists_label)
         form.addRow(self.create_label("Loan Lives (years):"), self.loan_lives)
@@ -7209,7 +7291,9 @@ class ProbabilisticPricingDialog(FluentDialog):
                 self.iterations.value(),
                 loan_lives,
                 interest_rates,
-                default_probs
+                default_probs,
+                stochastic=self.stochastic.isChecked(),
+                seed=self.seed.value()
             )
             
             # Connect signals
@@ -9139,8 +9223,24 @@ class ReportsDialog(FluentDialog):
         export_layout.addLayout(export_form)
         export_layout.addWidget(export_btn)
         
+        # Data export section (streamed directly from the database)
+        group_data = QGroupBox("Data Export (CSV)")
+        data_layout = QVBoxLayout(group_data)
+        
+        for label, export_method, default_name in [
+            ("Export Clients", self.report_generator.export_clients_to_csv, "clients.csv"),
+            ("Export Corporations", self.report_generator.export_corporations_to_csv, "corporations.csv"),
+            ("Export Loans", self.report_generator.export_loans_to_csv, "loans.csv"),
+        ]:
+            data_btn = QPushButton(label)
+            data_btn.clicked.connect(
+                lambda _, method=export_method, name=default_name: self.export_data_csv(method, name)
+            )
+            data_layout.addWidget(data_btn)
+        
         # Add all groups to the tab layout
         layout.addWidget(group_export)
+        layout.addWidget(group_data)
         layout.addStretch()
         
         self.tab_widget.addTab(tab, "Export Options")
@@ -9484,6 +9584,21 @@ class ReportsDialog(FluentDialog):
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to export report: {str(e)}")
             
+    def export_data_csv(self, export_method, default_name):
+        """Export a full table to CSV, streaming rows from the database."""
+        filepath, _ = QFileDialog.getSaveFileName(
+            self, "Save Data", default_name, "CSV Files (*.csv)"
+        )
+        
+        if not filepath:
+            return  # User cancelled
+            
+        try:
+            filepath = export_method(filepath)
+            QMessageBox.information(self, "Success", f"Data exported to CSV at: {filepath}")
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to export data: {str(e)}")
+            
     def show_report_result(self, text, title):
         """Display the report result in a text viewer dialog."""
         dialog = QDialog(self)
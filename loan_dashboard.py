@@ -1,7 +1,7 @@
 import json
 import base64
 import io
-from loan import DbManager
+from loan import DbManager, AsyncDbManager
 from loan_crm import LoanCRM
 from loan_report import LoanReport
 import time
@@ -45,7 +45,6 @@ class DashboardData:
             "charts": 3600         # 15 minutes
         }
         self._chart_cache = {}  # Cache for generated charts
-        self._thread_local = threading.local()  # For thread-local DB connections
         self._temp_files = []  # List to keep track of temporary files for cleanup
         
         # Check for required packages on initialization
@@ -170,20 +169,6 @@ class DashboardData:
             return {"error": f"Failed to retrieve dashboard data: {str(e)}", "is_error": True}
         
 
-    def _get_thread_connection(self):
-        """Get a thread-local database connection to prevent cursor conflicts"""
-        # Check if this thread already has a connection
-        if not hasattr(self._thread_local, 'conn'):
-            # Create a new connection for this thread
-            try:
-                # Modifica: usando get_connection invece di get_new_connection
-                self._thread_local.conn = self.db_manager.get_connection()
-            except Exception as e:
-                print(f"Error creating thread-local connection: {e}")
-                # Fall back to db_manager's connection
-                return None
-        return self._thread_local.conn
-
     def _get_cached_data(self, key: str) -> Optional[Any]:
         """Retrieve data from cache if valid"""
         cache_item = self._cache.get(key)
@@ -242,8 +227,20 @@ class DashboardData:
             return cached
             
         try:
-            # Utilizziamo solo il report già esistente
-            data = self.loan_report.generate_portfolio_summary()
+            # Le metriche sono mantenute in modo incrementale nel database:
+            # la lettura costa O(1) indipendentemente dal numero di prestiti
+            metrics = self.db_manager.load_portfolio_metrics()
+            total_loans = metrics['total_loans']
+            data = {
+                "Total Loans": total_loans,
+                "Total Loan Amount": metrics['total_amount'],
+                "Average Loan Amount": metrics['total_amount'] / total_loans if total_loans else 0,
+                "Average Initial Rate": metrics['avg_initial_rate'],
+                "Average Loan Term": int(round(metrics['avg_term'])),
+                "French Amortization Count": metrics['count_by_amortization_type'].get('French', 0),
+                "Italian Amortization Count": metrics['count_by_amortization_type'].get('Italian', 0),
+                "Total Interest to be Paid": metrics['total_interest']
+            }
             
             # Tutte le metriche dovrebbero essere già nel report, ma aggiungiamo valori default
             # in caso questi non fossero presenti
@@ -280,44 +277,32 @@ class DashboardData:
                 
             # Aggiunta delle metriche mancanti calcolate dal database
             try:
-                # Ottieni una connessione al database
-                thread_conn = self._get_thread_connection()
-                if thread_conn:
-                    conn = thread_conn
-                else:
-                    # Uso di get_connection invece di get_new_connection
-                    conn = self.db_manager.get_connection()
+                # Prende in prestito una connessione dal pool e la restituisce al termine
+                with self.db_manager.connection() as conn, conn.cursor() as cursor:
+                    # Total Clients
+                    cursor.execute("SELECT COUNT(*) FROM clients")
+                    data["total_clients"] = cursor.fetchone()[0]
                 
-                cursor = conn.cursor()
+                    # Client Interactions
+                    cursor.execute("SELECT COUNT(*) FROM client_interactions")
+                    data["total_interactions"] = cursor.fetchone()[0]
                 
-                # Total Clients
-                cursor.execute("SELECT COUNT(*) FROM clients")
-                data["total_clients"] = cursor.fetchone()[0]
-                
-                # Client Interactions
-                cursor.execute("SELECT COUNT(*) FROM client_interactions")
-                data["total_interactions"] = cursor.fetchone()[0]
-                
-                # Assicurati che altre metriche siano presenti con valori predefiniti
-                if "active_clients" not in data:
-                    # Consideriamo attivi i clienti che hanno avuto interazioni negli ultimi 90 giorni
-                    cursor.execute("""
-                        SELECT COUNT(DISTINCT client_id) FROM client_interactions 
-                        WHERE interaction_date >= NOW() - INTERVAL '90 days'
-                    """)
-                    data["active_clients"] = cursor.fetchone()[0]
-                    
-                if "new_clients_last_30_days" not in data:
-                    cursor.execute("""
-                        SELECT COUNT(*) FROM clients 
-                        WHERE created_at >= NOW() - INTERVAL '30 days'
-                    """)
-                    data["new_clients_last_30_days"] = cursor.fetchone()[0]
-                
-                # Close the connection if we created a new one
-                if not thread_conn:
-                    conn.close()
+                    # Assicurati che altre metriche siano presenti con valori predefiniti
+                    if "active_clients" not in data:
+                        # Consideriamo attivi i clienti che hanno avuto interazioni negli ultimi 90 giorni
+                        cursor.execute("""
+                            SELECT COUNT(DISTINCT client_id) FROM client_interactions 
+                            WHERE interaction_date >= NOW() - INTERVAL '90 days'
+                        """)
+                        data["active_clients"] = cursor.fetchone()[0]
                     
+                    if "new_clients_last_30_days" not in data:
+                        cursor.execute("""
+                            SELECT COUNT(*) FROM clients 
+                            WHERE created_at >= NOW() - INTERVAL '30 days'
+                        """)
+                        data["new_clients_last_30_days"] = cursor.fetchone()[0]
+
             except Exception as e:
                 print(f"Error calculating additional CRM metrics: {e}")
                 # Set default values if calculation fails
@@ -471,11 +456,8 @@ class DashboardData:
                     """
                     
                     # Esegui entrambe le query
-                    cursor_clients = self.db_manager.execute_db_query(clients_query)
-                    rows_clients = cursor_clients.fetchall()
-                    
-                    cursor_corps = self.db_manager.execute_db_query(corporations_query)
-                    rows_corps = cursor_corps.fetchall()
+                    rows_clients = self.db_manager.execute_db_query(clients_query).fetchall()
+                    rows_corps = self.db_manager.execute_db_query(corporations_query).fetchall()
                     
                     # Combina i risultati in un unico dizionario
                     data = {}
@@ -1310,14 +1292,7 @@ class DashboardData:
         return cleaned_files
 
     def __del__(self):
-        """Clean up thread-local connections and temporary files on object destruction"""
-        try:
-            if hasattr(self._thread_local, 'conn'):
-                if self._thread_local.conn:
-                    self._thread_local.conn.close()
-        except:
-            pass
-            
+        """Clean up temporary files on object destruction"""
         # Add cleanup for temp files
         try:
             self.cleanup_temp_files()
@@ -1328,8 +1303,11 @@ class DashboardBackend:
     """
     Ottimizzato per prestazioni elevate nel fornire dati alla dashboard
     """
-    def __init__(self, db_manager: DbManager):
+    def __init__(self, db_manager: DbManager, async_db: AsyncDbManager = None):
         self.dashboard_data = DashboardData(db_manager)
+        # Gli aggiornamenti automatici girano in background, non nel thread della UI
+        self.async_db = async_db or AsyncDbManager(db_manager, max_workers=2)
+        self._pending_refresh = None
         self.last_update_time = 0
         self.cache = {"priority": {}, "full": {}}
         self.update_interval = 5  # secondi
@@ -1392,6 +1370,16 @@ class DashboardBackend:
                 import json
                 return json.dumps(self.cache[cache_key], default=str)
         
+    def refresh_dashboard_async(self, force=False, priority_only=False):
+        """
+        Avvia refresh_dashboard in background e restituisce il Future.
+        Se un aggiornamento è già in corso restituisce quello, senza accodarne altri.
+        """
+        if self._pending_refresh is not None and not self._pending_refresh.done():
+            return self._pending_refresh
+        self._pending_refresh = self.async_db.submit(self.refresh_dashboard, force, priority_only)
+        return self._pending_refresh
+
 # Nella classe DashboardBackend
 
     def start_auto_refresh(self, interval=None):
@@ -1401,7 +1389,7 @@ class DashboardBackend:
         # Assicura che il timer sia creato nel thread dell'UI
         if not hasattr(self, 'refresh_timer'):
             self.refresh_timer = QTimer()
-            self.refresh_timer.timeout.connect(self.refresh_dashboard)
+            self.refresh_timer.timeout.connect(self.refresh_dashboard_async)
         
         # Imposta l'intervallo (default 60 secondi se non specificato)
         interval_ms = (interval or 60) * 1000
@@ -1416,6 +1404,8 @@ class DashboardBackend:
     def stop_auto_refresh(self):
         """Stop automatic refresh"""
         self.running = False
+        if hasattr(self, 'refresh_timer'):
+            self.refresh_timer.stop()
         if self.update_thread:
             # The thread will terminate naturally after the next sleep cycle
             self.update_thread = None
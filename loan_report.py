@@ -1,9 +1,10 @@
-from loan import Loan, DbManager
+from loan import Loan, DbManager, PortfolioSchedules, portfolio_taeg
 from loan_crm import LoanCRM
 import pandas as pd
 import numpy as np
 import datetime as dt
 import os
+import csv
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -66,28 +67,42 @@ class LoanReport:
     def generate_portfolio_summary(self):
         """
         Genera un report di sintesi del portafoglio di prestiti.
+        
+        Conteggi, somme, medie, ripartizione per tipo di ammortamento e interessi totali sono
+        aggregati direttamente in SQL sui piani salvati; solo i prestiti con piano mancante o
+        non aggiornato (e i variabili, per il TAEG) vengono ricostruiti in Python.
         """
         # SOLUZIONE RADICALE: Ignora completamente Loan.loans e lavora direttamente con il DB
         try:
-            # Carica i dati direttamente dal database senza usare Loan.loans
-            loans_data = self.db_manager.load_all_loans_from_db()
+            aggregates = self.db_manager.load_portfolio_aggregates()
             
-            if not loans_data:
+            if not aggregates['total_loans']:
                 return "Nessun prestito trovato."
             
-            total_loans = len(loans_data)
-            total_amount = sum(float(loan[3]) for loan in loans_data)  # loan_amount è nella posizione 3
-            avg_initial_rate = np.mean([float(loan[1]) for loan in loans_data])  # rate è nella posizione 1
-            
-            # Per TAEG e interesse totale, dovrai caricare individualmente ogni prestito
-            # ma NON aggiungerli alla lista statica Loan.loans
-            taeg_values_periodic = []
-            taeg_values_annualized = []
-            total_interest = 0
+            total_loans = aggregates['total_loans']
+            total_amount = aggregates['total_amount']
+            avg_initial_rate = aggregates['avg_initial_rate']
+            by_type = aggregates['by_amortization_type']
+            total_interest = aggregates['schedule_interest']
+            taeg_inputs = aggregates['taeg_inputs']
+            
+            # Prestiti da ricostruire in Python: piani mancanti/non aggiornati e tassi variabili
+            stale_ids = set(aggregates['stale_loan_ids'])
+            variable_ids = {str(row[0]) for row in taeg_inputs if row[5] != 'fixed'}
+            fallback_rows = self.db_manager.load_loans_by_ids(stale_ids | variable_ids)
+            
+            # Interessi dei prestiti a tasso fisso con piano non valido, calcolati in blocco
+            schedules = PortfolioSchedules.from_db_rows(
+                [row for row in fallback_rows if str(row[0]) in stale_ids]
+            )
+            total_interest += float(schedules.totals('Interest').sum())
             
-            for loan_data in loans_data:
+            fallback_loans = {}
+            for loan_data in fallback_rows:
                 loan_id = str(loan_data[0])
-                loan = Loan(
+                if loan_id in schedules:
+                    continue
+                fallback_loans[loan_id] = Loan(
                     db_manager=self.db_manager,
                     rate=float(loan_data[1]),
                     term=int(loan_data[2]),
@@ -100,52 +115,39 @@ class LoanReport:
                     downpayment_percent=float(loan_data[9]),
                     start=loan_data[10].isoformat(),
                     loan_id=loan_id,
-                    should_save=False
+                    should_save=False,
+                    loaded=True
                 )
-                
-                # Carica i costi aggiuntivi e le spese periodiche
-                loan.additional_costs = self.db_manager.load_additional_costs(loan_id)
-                loan.periodic_expenses = self.db_manager.load_periodic_expenses(loan_id)
-                
-                # Calcola TAEG e tabella
-                loan.table = loan.loan_table()
-                loan.calculate_taeg()
-                
-                if hasattr(loan, 'taeg') and loan.taeg:
-                    # Assicurati che i valori siano nel formato corretto (decimale)
-                    periodic_value = loan.taeg.get('periodic', 0)
-                    annualized_value = loan.taeg.get('annualized', 0)
-                    
-                    # Normalizza i valori se sono percentuali superiori a 1
-                    if isinstance(periodic_value, (int, float)) and periodic_value > 1:
-                        periodic_value = periodic_value / 100
-                    if isinstance(annualized_value, (int, float)) and annualized_value > 1:
-                        annualized_value = annualized_value / 100
-                        
-                    # Ora aggiungi i valori normalizzati
-                    taeg_values_periodic.append(periodic_value)
-                    taeg_values_annualized.append(annualized_value)
-                
-                total_interest += loan.table["Interest"].cumsum().iloc[-1]
-                
-                # NON aggiungere alla lista statica Loan.loans
+                if loan_id in stale_ids:
+                    total_interest += fallback_loans[loan_id].table["Interest"].sum()
+            
+            taeg_periodic, taeg_annualized = portfolio_taeg(taeg_inputs, fallback_loans)
+            
+            # Assicurati che i valori siano nel formato corretto (decimale):
+            # normalizza i valori se sono percentuali superiori a 1
+            taeg_periodic = np.where(taeg_periodic > 1, taeg_periodic / 100, taeg_periodic)
+            taeg_annualized = np.where(taeg_annualized > 1, taeg_annualized / 100, taeg_annualized)
             
-            avg_taeg_periodic = np.mean(taeg_values_periodic) if taeg_values_periodic else 0
-            avg_taeg_annualized = np.mean(taeg_values_annualized) if taeg_values_annualized else 0
+            avg_taeg_periodic = float(np.mean(taeg_periodic)) if taeg_periodic.size else 0
+            avg_taeg_annualized = float(np.mean(taeg_annualized)) if taeg_annualized.size else 0
             
             summary = {
                 "Total Loans": total_loans,
                 "Total Loan Amount": total_amount,
+                "Average Loan Amount": total_amount / total_loans,
                 "Average Initial Rate": avg_initial_rate,
+                "Average Loan Term": int(round(aggregates['avg_term'])),
+                "French Amortization Count": by_type.get('French', {}).get('count', 0),
+                "Italian Amortization Count": by_type.get('Italian', {}).get('count', 0),
                 "Average TAEG Periodic (%)": avg_taeg_periodic,
                 "Average TAEG Annualized (%)": avg_taeg_annualized,
-                "Total Interest to be Paid": total_interest
+                "Total Interest to be Paid": float(total_interest)
             }
             return summary
         except Exception as e:
             print(f"Errore nella generazione del report di portafoglio: {e}")
             return "Errore nella generazione del report."
-        
+    
     def generate_comparative_report(self, loans: list = None):
         """
         Genera un report comparativo tra prestiti.
@@ -184,6 +186,8 @@ class LoanReport:
         
         Parametri addizionali possono essere passati via kwargs e verranno
         propagati al metodo calculate_probabilistic_pricing del prestito.
+        Salvo diversa indicazione (use_cache, seed) il risultato è letto e salvato nella cache
+        del pricing e il modello stocastico usa il seed 42, così un report ripetuto è immediato.
         
         Restituisce tipicamente un oggetto (DataFrame o Pandas Styler) con i risultati.
         """
@@ -191,10 +195,13 @@ class LoanReport:
         loan = next((l for l in loans if l.loan_id == loan_id), None)
         if loan is None:
             raise ValueError(f"Prestito con ID {loan_id} non trovato.")
+        kwargs.setdefault('use_cache', True)
+        if kwargs.get('stochastic'):
+            kwargs.setdefault('seed', 42)
         report = loan.calculate_probabilistic_pricing(**kwargs)
         return report
     
-    def generate_client_segmentation_report(self):
+    def generate_client_segmentation_report(self, sample_size: int = 20000, itersize: int = 2000):
         """
         Genera un report di segmentazione dei clienti basato su parametri rilevanti.
         
@@ -204,25 +211,16 @@ class LoanReport:
         - Segmentazione per credit score
         - Clustering automatico basato su parametri multipli
         
+        I clienti vengono letti in streaming: le distribuzioni sono accumulate riga per riga,
+        il clustering viene addestrato su un campione casuale di al più sample_size clienti
+        (tutti, se sono meno) e poi applicato all'intera base clienti in un secondo passaggio.
+        
         Restituisce un dizionario con i risultati della segmentazione.
         """
         if self.loan_crm is None:
             raise Exception("Modulo CRM non disponibile per la segmentazione.")
-            
-        clients = self.loan_crm.list_clients()
-        if not clients:
-            return {"error": "Nessun cliente trovato"}
-            
-        # Recupero dati dettagliati dei clienti
-        client_details = []
-        for client in clients:
-            client_id = client.get("client_id")
-            details = self.loan_crm.get_client_details(client_id)  # Assumo esista questo metodo
-            if details:
-                client_details.append(details)
         
-        # Converto in DataFrame per facilitare l'analisi
-        df_clients = pd.DataFrame(client_details)
+        features = ['income', 'age', 'credit_score', 'loan_count', 'total_debt']
         
         # 1. Segmentazione per fasce di reddito
         income_segments = {
@@ -231,14 +229,6 @@ class LoanReport:
             'Alto': (70000, float('inf'))
         }
         
-        income_distribution = {}
-        for segment, (min_val, max_val) in income_segments.items():
-            count = len(df_clients[(df_clients['income'] >= min_val) & (df_clients['income'] < max_val)])
-            income_distribution[segment] = count
-        
-        # 2. Segmentazione per area geografica
-        geo_distribution = df_clients['region'].value_counts().to_dict()
-        
         # 3. Segmentazione per credit score
         credit_segments = {
             'Rischio alto': (300, 580),
@@ -247,10 +237,47 @@ class LoanReport:
             'Eccellente': (740, 850)
         }
         
-        credit_distribution = {}
-        for segment, (min_val, max_val) in credit_segments.items():
-            count = len(df_clients[(df_clients['credit_score'] >= min_val) & (df_clients['credit_score'] < max_val)])
-            credit_distribution[segment] = count
+        income_distribution = dict.fromkeys(income_segments, 0)
+        credit_distribution = dict.fromkeys(credit_segments, 0)
+        geo_counts = {}
+        
+        # Primo passaggio: distribuzioni e campione (reservoir sampling) delle feature per il clustering
+        rng = np.random.default_rng(42)
+        sample = np.empty((sample_size, len(features)))
+        total_clients = 0
+        for client in self.loan_crm.iter_client_features(itersize):
+            income = client['income']
+            credit_score = client['credit_score']
+            
+            if income is not None:
+                for segment, (min_val, max_val) in income_segments.items():
+                    if min_val <= income < max_val:
+                        income_distribution[segment] += 1
+                        break
+            
+            if credit_score is not None:
+                for segment, (min_val, max_val) in credit_segments.items():
+                    if min_val <= credit_score < max_val:
+                        credit_distribution[segment] += 1
+                        break
+            
+            # 2. Segmentazione per area geografica
+            geo_counts[client['region']] = geo_counts.get(client['region'], 0) + 1
+            
+            row = [client[col] if client[col] is not None else 0.0 for col in features]
+            if total_clients < sample_size:
+                sample[total_clients] = row
+            else:
+                slot = rng.integers(0, total_clients + 1)
+                if slot < sample_size:
+                    sample[slot] = row
+            total_clients += 1
+        
+        if total_clients == 0:
+            return {"error": "Nessun cliente trovato"}
+        
+        sample = sample[:min(total_clients, sample_size)]
+        geo_distribution = dict(sorted(geo_counts.items(), key=lambda item: item[1], reverse=True))
         
         # 4. Clustering automatico con K-means
         from sklearn.cluster import KMeans
@@ -258,20 +285,15 @@ class LoanReport:
         from sklearn.metrics import silhouette_score
         from sklearn.preprocessing import StandardScaler
         
-        # Selezione feature per clustering
-        features = ['income', 'age', 'credit_score', 'loan_count', 'total_debt']
-        feature_cols = [col for col in features if col in df_clients.columns]
-        
-        if feature_cols:
+        if len(sample) > 1:
             # Normalizzazione dei dati
-            X = df_clients[feature_cols].fillna(0)
             scaler = StandardScaler()
-            X_scaled = scaler.fit_transform(X)
+            X_scaled = scaler.fit_transform(sample)
             
 
             # Trova il numero ottimale di cluster
             # Imposta range di possibili cluster da valutare
-            max_clusters = min(10, len(df_clients) - 1)  # Evita più cluster che dati
+            max_clusters = min(10, len(sample) - 1)  # Evita più cluster che dati
             range_clusters = range(2, max_clusters + 1)
 
             # Vettori per memorizzare metriche di valutazione
@@ -288,7 +310,9 @@ class LoanReport:
                 # Silhouette score (ignora warning per k=n o k=1)
                 with warnings.catch_warnings():
                     warnings.simplefilter("ignore")
-                    silhouette_scores.append(silhouette_score(X_scaled, kmeans.labels_))
+                    silhouette_scores.append(silhouette_score(
+                        X_scaled, kmeans.labels_, sample_size=min(len(X_scaled), 5000), random_state=42
+                    ))
 
             # Metodo del gomito (cerca dove la pendenza cambia significativamente)
             if len(wcss) > 2:
@@ -308,21 +332,45 @@ class LoanReport:
             n_clusters = int(np.ceil((elbow_k + silhouette_k) / 2))
 
             # Garantisce limiti ragionevoli per n_clusters
-            n_clusters = max(2, min(n_clusters, len(df_clients) // 5))  # Min 2, max 1/5 dei dati
+            n_clusters = max(2, min(n_clusters, total_clients // 5))  # Min 2, max 1/5 dei dati
 
             # Applica K-means
             kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-            df_clients['cluster'] = kmeans.fit_predict(X_scaled)
+            kmeans.fit(X_scaled)
+            
+            # Secondo passaggio: assegna ogni cliente a un cluster e accumula i profili
+            counts = np.zeros(n_clusters, dtype=np.int64)
+            profile_sums = np.zeros((n_clusters, 3))
+            profile_counts = np.zeros((n_clusters, 3), dtype=np.int64)
+            
+            def _accumulate(chunk):
+                raw = np.array(chunk, dtype=float)
+                labels = kmeans.predict(scaler.transform(np.nan_to_num(raw, nan=0.0)))
+                profile = raw[:, :3]  # income, age, credit_score
+                valid = ~np.isnan(profile)
+                np.add.at(counts, labels, 1)
+                np.add.at(profile_sums, labels, np.where(valid, profile, 0.0))
+                np.add.at(profile_counts, labels, valid)
+            
+            chunk = []
+            for client in self.loan_crm.iter_client_features(itersize):
+                chunk.append([np.nan if client[col] is None else client[col] for col in features])
+                if len(chunk) == itersize:
+                    _accumulate(chunk)
+                    chunk = []
+            if chunk:
+                _accumulate(chunk)
             
             # Analisi dei cluster
+            with np.errstate(invalid='ignore', divide='ignore'):
+                profile_means = profile_sums / profile_counts
             cluster_profiles = {}
             for i in range(n_clusters):
-                cluster_data = df_clients[df_clients['cluster'] == i]
                 cluster_profiles[f'Cluster {i+1}'] = {
-                    'count': len(cluster_data),
-                    'avg_income': cluster_data['income'].mean() if 'income' in df_clients else 'N/A',
-                    'avg_age': cluster_data['age'].mean() if 'age' in df_clients else 'N/A',
-                    'avg_credit_score': cluster_data['credit_score'].mean() if 'credit_score' in df_clients else 'N/A'
+                    'count': int(counts[i]),
+                    'avg_income': profile_means[i, 0],
+                    'avg_age': profile_means[i, 1],
+                    'avg_credit_score': profile_means[i, 2]
                 }
         else:
             cluster_profiles = {'error': 'Dati insufficienti per clustering'}
@@ -351,17 +399,16 @@ class LoanReport:
         if self.loan_crm is None:
             raise Exception("Modulo CRM non disponibile per il report.")
             
-        clients = self.loan_crm.list_clients()
-        total_clients = len(clients)
         interactions_count = []
         loans_count = []
-        for client in clients:
+        for client in self.loan_crm.iter_clients():
             client_id = client.get("client_id")
             interactions = self.loan_crm.get_interactions(client_id)
             interactions_count.append(len(interactions))
             client_loans = self.loan_crm.get_client_loans(client_id)
             loans_count.append(len(client_loans))
             
+        total_clients = len(interactions_count)
         avg_interactions = np.mean(interactions_count) if interactions_count else 0
         avg_loans = np.mean(loans_count) if loans_count else 0
         
@@ -398,6 +445,47 @@ class LoanReport:
         report_df.to_csv(filepath, index=True)
         return os.path.abspath(filepath)
     
+    def export_rows_to_csv(self, rows, filepath: str, columns: list = None):
+        """
+        Esporta in CSV un iterabile di righe (dizionari o tuple) scrivendole una alla volta,
+        senza materializzarle in un DataFrame. Con righe-tupla va indicato columns.
+        
+        Restituisce il percorso assoluto del file esportato.
+        """
+        with open(filepath, 'w', newline='', encoding='utf-8') as csv_file:
+            writer = None
+            for row in rows:
+                if writer is None:
+                    writer = csv.writer(csv_file)
+                    if columns is None:
+                        columns = list(row.keys())
+                    writer.writerow(columns)
+                writer.writerow([row.get(col) for col in columns] if isinstance(row, dict) else row)
+            if writer is None and columns:
+                csv.writer(csv_file).writerow(columns)
+        return os.path.abspath(filepath)
+
+    def export_clients_to_csv(self, filepath: str, itersize: int = 2000):
+        """Esporta tutti i clienti in CSV leggendoli in streaming dal database."""
+        if self.loan_crm is None:
+            raise Exception("Modulo CRM non disponibile per l'esportazione.")
+        return self.export_rows_to_csv(self.loan_crm.iter_clients(itersize), filepath)
+
+    def export_corporations_to_csv(self, filepath: str, itersize: int = 2000):
+        """Esporta tutte le aziende in CSV leggendole in streaming dal database."""
+        if self.loan_crm is None:
+            raise Exception("Modulo CRM non disponibile per l'esportazione.")
+        return self.export_rows_to_csv(self.loan_crm.iter_corporations(itersize), filepath)
+
+    def export_loans_to_csv(self, filepath: str, itersize: int = 2000):
+        """Esporta tutti i prestiti in CSV leggendoli in streaming dal database."""
+        columns = [
+            'loan_id', 'initial_rate', 'initial_term', 'loan_amount',
+            'amortization_type', 'frequency', 'rate_type', 'use_euribor',
+            'update_frequency', 'downpayment_percent', 'start_date', 'active'
+        ]
+        return self.export_rows_to_csv(self.db_manager.iter_all_loans_from_db(itersize), filepath, columns)
+
     def generate_forecasting_report(self, frequency: str = 'monthly', start: str = '1994-01-01', end: str = None):
         """
         Genera un report predittivo basato sui dati storici dell'Euribor.
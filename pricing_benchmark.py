@@ -0,0 +1,116 @@
+"""
+Benchmark di scalabilità del pricing probabilistico stocastico.
+
+Esegue Loan.calculate_probabilistic_pricing(stochastic=True) per ogni modalità di
+esecuzione ('threads', 'prange', 'processes') e per un numero crescente di worker,
+e riporta tempo, simulazioni al secondo, speedup ed efficienza rispetto a un worker.
+
+In tutte le modalità i risultati dei batch tornano al processo principale e vengono sommati
+nell'ordine delle iterazioni, con al più max_workers * 4 batch in corso: non ci sono array
+di risultati in memoria condivisa, che crescevano con num_iterations. Un batch restituisce
+al più qualche decina di KB di IRR contro secondi di calcolo, quindi il trasferimento dei
+risultati non dovrebbe limitare la scalabilità; va verificato sulla macchina di destinazione.
+
+La scalabilità si misura solo con tanti worker quanti sono i core disponibili: eseguire il
+benchmark su una macchina multi-core e allegare il CSV prodotto con --csv.
+
+Esempio:
+    python pricing_benchmark.py --iterations 200000 --workers 1 2 4 8 16 32 --csv scaling.csv
+"""
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+
+from loan import Loan, shutdown_pricing_process_pool
+
+
+def _default_workers():
+    cpus = os.cpu_count() or 1
+    workers = [1]
+    while workers[-1] * 2 <= cpus:
+        workers.append(workers[-1] * 2)
+    if workers[-1] != cpus:
+        workers.append(cpus)
+    return workers
+
+
+def run_benchmark(iterations, modes, workers, repeats=1, seed=42):
+    loan = Loan(
+        db_manager=None, rate=0.05, term=20, loan_amount=200000,
+        amortization_type='French', frequency='monthly',
+        start='2024-01-01', should_save=False
+    )
+    params = dict(
+        num_iterations=iterations,
+        loan_lives=[5, 10, 20],
+        interest_rates=np.array([0.03, 0.05, 0.07]),
+        default_probabilities=[0.01, 0.02, 0.05],
+        stochastic=True,
+        seed=seed,
+        # Ogni misura deve simulare davvero: niente risultati dalla cache
+        use_cache=False,
+    )
+    simulations = iterations * 3 * 3 * 3
+
+    results = []
+    for mode in modes:
+        # Compilazione JIT dei kernel della modalità (e cache su disco per i processi) fuori dalle misure
+        loan.calculate_probabilistic_pricing(**{**params, 'num_iterations': 10}, execution_mode=mode, max_workers=1)
+        baseline = None
+        for n in workers:
+            if mode == 'processes':
+                # Avvio del pool con n processi (import del modulo e caricamento dei kernel) fuori dalle misure
+                # (almeno un batch da 2000 simulazioni per processo)
+                loan.calculate_probabilistic_pricing(
+                    **{**params, 'num_iterations': 100 * n}, execution_mode=mode, max_workers=n
+                )
+            elapsed = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                loan.calculate_probabilistic_pricing(**params, execution_mode=mode, max_workers=n)
+                elapsed.append(time.perf_counter() - start)
+            best = min(elapsed)
+            baseline = baseline or best
+            speedup = baseline / best
+            results.append((mode, n, best, simulations / best, speedup, speedup / n))
+            print(f"{mode:<10} {n:>4} worker  {best:8.2f}s  {simulations / best:12,.0f} sim/s  "
+                  f"speedup {speedup:5.2f}x  efficienza {speedup / n:6.1%}", flush=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark di scalabilità del pricing probabilistico")
+    parser.add_argument('--iterations', type=int, default=100000,
+                        help="iterazioni per combinazione (27 combinazioni)")
+    parser.add_argument('--modes', nargs='+', default=list(Loan.PRICING_EXECUTION_MODES),
+                        choices=Loan.PRICING_EXECUTION_MODES)
+    parser.add_argument('--workers', nargs='+', type=int, default=_default_workers())
+    parser.add_argument('--repeats', type=int, default=3, help="ripetizioni per misura (si tiene la migliore)")
+    parser.add_argument('--csv', help="file CSV in cui salvare i risultati")
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    print(f"CPU disponibili: {cpus}, iterazioni per combinazione: {args.iterations:,}")
+    if max(args.workers) > cpus:
+        print(f"WARN: oltre {cpus} worker le misure non indicano la scalabilità (core insufficienti)")
+    try:
+        results = run_benchmark(args.iterations, args.modes, args.workers, args.repeats)
+    finally:
+        shutdown_pricing_process_pool()
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['mode', 'workers', 'cpus', 'iterations', 'seconds',
+                             'simulations_per_second', 'speedup', 'efficiency'])
+            for mode, n, best, rate, speedup, efficiency in results:
+                writer.writerow([mode, n, cpus, args.iterations, f"{best:.4f}", f"{rate:.0f}",
+                                 f"{speedup:.3f}", f"{efficiency:.3f}"])
+        print(f"Risultati salvati in {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import numpy as np
+import numpy_financial as npf
+import pytest
+from scipy.optimize import brentq
+
+from loan_analyst import IRR_FAILED, solve_irr_batch, solve_taeg_batch
+
+
+def _annuity(amount, annual_rate, periods, periods_per_year=12):
+    payment = -npf.pmt(annual_rate / periods_per_year, periods, amount)
+    return np.r_[-amount, np.full(periods, payment)]
+
+
+def _defaulted_path(amount, annual_rate, periods, default_period, recovery=0.4, periods_per_year=12):
+    """Rate regolari fino a default_period, poi il recupero sul debito residuo."""
+    period_rate = annual_rate / periods_per_year
+    payment = -npf.pmt(period_rate, periods, amount)
+    balance = amount
+    flows = [-amount]
+    for _ in range(default_period):
+        flows.append(payment)
+        balance -= payment - balance * period_rate
+    flows.append(recovery * balance)
+    return np.array(flows)
+
+
+CASHFLOWS = [
+    _annuity(200000, 0.05, 240),
+    _annuity(200000, 0.05, 360),
+    _annuity(150000, 0.12, 360),
+    _defaulted_path(200000, 0.05, 240, 199),
+    _defaulted_path(200000, 0.05, 360, 300, recovery=0.2),
+    _defaulted_path(100000, 0.03, 240, 12),
+]
+
+
+@pytest.mark.parametrize("cashflows", CASHFLOWS)
+def test_long_vectors_match_numpy_financial(cashflows):
+    rates, status = solve_irr_batch([cashflows])
+    assert status[0] != IRR_FAILED
+    assert rates[0] == pytest.approx(npf.irr(cashflows), abs=1e-9)
+
+
+@pytest.mark.parametrize("cashflows", CASHFLOWS)
+def test_bracketed_fallback_on_long_vectors(cashflows):
+    # max_iter=0 salta Newton: la radice deve essere trovata dalla sola bisezione
+    rates, status = solve_irr_batch([cashflows], max_iter=0)
+    assert status[0] != IRR_FAILED
+    assert rates[0] == pytest.approx(npf.irr(cashflows), abs=1e-9)
+
+
+def test_batch_of_mixed_lengths():
+    rates, status = solve_irr_batch(CASHFLOWS)
+    expected = [npf.irr(cashflows) for cashflows in CASHFLOWS]
+    assert (status != IRR_FAILED).all()
+    np.testing.assert_allclose(rates, expected, atol=1e-9)
+
+
+def test_no_sign_change_fails():
+    rates, status = solve_irr_batch([np.full(240, 100.0)])
+    assert np.isnan(rates[0])
+    assert status[0] == IRR_FAILED
+
+
+def test_taeg_batch_matches_brentq():
+    net = np.array([190000.0, 95000.0, 10000.0, 1000.0])
+    gross = np.array([1319.91, 1100.0, 900.0, 10.0])
+    periods = np.array([240, 120, 12, 12])
+    periods_per_year = np.array([12, 12, 12, 12])
+    rates = solve_taeg_batch(net, gross, periods, periods_per_year)
+    for i in range(3):
+        years = np.arange(1, periods[i] + 1) / periods_per_year[i]
+        expected = brentq(lambda r: gross[i] * np.sum((1 + r) ** -years) - net[i], 0, 1)
+        assert rates[i] == pytest.approx(expected, abs=1e-10)
+    # Nessuna soluzione in [0, 1]: i pagamenti non coprono l'importo netto
+    assert np.isnan(rates[3])